@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""Benchmark of evaluating the notification rules over a table of
+subscriptions.
+
+Run with `python -m benchmarks.rules [--subscriptions N]`.
+"""
+import argparse
+import time
+from datetime import datetime
+from datetime import timedelta
+
+from torweather.rules import evaluate
+from torweather.rules import Subscriptions
+from torweather.schemas import RelayRecord
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscriptions", type=int, default=100000)
+    args = parser.parse_args()
+    now = datetime.utcnow()
+    relays = {
+        f"{index:040X}": RelayRecord(
+            nickname=f"relay{index}",
+            fingerprint=f"{index:040X}",
+            last_seen=now - timedelta(hours=index % 100),
+            running=index % 100 == 0,
+            consensus_weight=1,
+            last_restarted=now,
+            bandwidth_rate=1,
+            effective_family=[],
+            version_status="unrecommended" if index % 7 == 0 else "recommended",
+            recommended_version=index % 7 != 0,
+        )
+        for index in range(args.subscriptions)
+    }
+    documents = [
+        {
+            "fingerprint": fingerprint,
+            "email": "operator@gmail.com",
+            "NODE_DOWN": {"sent": False, "duration": 48},
+            "OUTDATED_VER": {"sent": False},
+        }
+        for fingerprint in relays
+    ]
+    start = time.perf_counter()
+    subscriptions = Subscriptions(documents, relays, ["NODE_DOWN", "OUTDATED_VER"])
+    built = time.perf_counter()
+    due = evaluate(subscriptions, now)
+    evaluated = time.perf_counter()
+    print(
+        f"{len(subscriptions)} subscriptions: table built in "
+        f"{(built - start) * 1000:.1f} ms, rules evaluated in "
+        f"{(evaluated - built) * 1000:.1f} ms "
+        f"({', '.join(f'{notif}: {len(indexes)} due' for notif, indexes in due.items())})"
+    )
+
+
+if __name__ == "__main__":
+    main()
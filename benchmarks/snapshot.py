@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""Benchmark of building a snapshot of relay data from an onionoo details
+document, comparing pydantic RelayData models with slotted RelayRecords.
+
+Run with `python -m benchmarks.snapshot [--relays N]`.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from collections.abc import Callable
+from collections.abc import Mapping
+from collections.abc import Sequence
+from typing import Any
+
+from torweather.schemas import RelayData
+from torweather.schemas import RelayRecord
+
+
+def relays(count: int) -> Sequence[Mapping[str, Any]]:
+    """Returns relays in the format of an onionoo details document."""
+    return [
+        {
+            "nickname": f"relay{index}",
+            "fingerprint": f"{index:040X}",
+            "last_seen": "2022-03-20 10:00:00",
+            "running": index % 10 != 0,
+            "consensus_weight": index * 10,
+            "last_restarted": "2022-03-01 08:30:00",
+            "bandwidth_rate": 1073741824,
+            "effective_family": [f"{index:040X}", f"{index + 1:040X}"],
+            "version_status": "recommended" if index % 7 else "unrecommended",
+            "recommended_version": bool(index % 7),
+        }
+        for index in range(count)
+    ]
+
+
+def measure(
+    name: str,
+    build: Callable[[Mapping[str, Any]], Any],
+    data: Sequence[Mapping[str, Any]],
+) -> None:
+    """Print the build time and memory held by a fingerprint map. Time is
+    measured without tracing memory, as tracing slows down allocations."""
+    gc.collect()
+    start = time.perf_counter()
+    snapshot = {relay["fingerprint"]: build(relay) for relay in data}
+    elapsed = time.perf_counter() - start
+    del snapshot
+    gc.collect()
+    tracemalloc.start()
+    snapshot = {relay["fingerprint"]: build(relay) for relay in data}
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:<12} {len(snapshot):>7} relays  {elapsed * 1000:>8.1f} ms  "
+        f"{current / 2**20:>7.2f} MiB held  {peak / 2**20:>7.2f} MiB peak"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--relays", type=int, default=10000)
+    args = parser.parse_args()
+    data = relays(args.relays)
+    measure("RelayData", lambda relay: RelayData(**relay), data)
+    measure("RelayRecord", RelayRecord.from_onionoo, data)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+from flask import Flask
+
+from torweather.config import secrets
+from torweather.routes.api import api
+
+app = Flask(__name__)
+app.register_blueprint(api, url_prefix="/api")
+
+
+def test_authentication(monkeypatch):
+    client = app.test_client()
+    # The API is disabled without a token.
+    assert client.post("/api/subscriptions", json=[]).status_code == 401
+    monkeypatch.setattr(secrets, "API_TOKEN", "token")
+    assert client.post("/api/subscriptions", json=[]).status_code == 401
+    response = client.post(
+        "/api/subscriptions", json=[], headers={"Authorization": "Bearer wrong"}
+    )
+    assert response.status_code == 401
+    response = client.post(
+        "/api/subscriptions", json=[], headers={"Authorization": "Bearer token"}
+    )
+    assert response.status_code == 200
+    assert response.get_json() == {"results": []}
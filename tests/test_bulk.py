@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+from torweather.bulk import BulkSubscriber
+
+test_fingerprint: str = "000A10D43011EA4928A35F610405F92B4433B4DC"
+test_email: str = "myemail@gmail.com"
+
+
+def test_subscribe():
+    subscriber = BulkSubscriber(testing=True)
+    entries = [
+        {"fingerprint": test_fingerprint, "email": test_email, "notifs": ["NODE_DOWN"]},
+        {"fingerprint": test_fingerprint, "email": test_email, "notifs": ["NODE_DOWN"]},
+        {"fingerprint": "0" * 40, "email": test_email, "notifs": ["NODE_DOWN"]},
+        {"fingerprint": test_fingerprint, "email": test_email, "notifs": ["BOGUS"]},
+    ]
+    try:
+        results = subscriber.subscribe(entries)
+        assert [result["status"] for result in results] == ["subscribed"] + [
+            "invalid"
+        ] * 3
+        assert results[0]["nickname"] == "seele"
+        results = subscriber.subscribe(entries[:1])
+        assert results[0]["status"] == "exists"
+    finally:
+        subscriber.collection.delete_one({"fingerprint": test_fingerprint})
+
+
+def test_subscribe_invalid():
+    subscriber = BulkSubscriber(testing=True)
+    entries = [
+        {"fingerprint": "0", "email": test_email, "notifs": ["NODE_DOWN"]},
+        {"fingerprint": test_fingerprint, "email": test_email, "notifs": ["BOGUS"]},
+    ]
+    # No relay is looked up, nor the database queried, without a valid entry.
+    results = subscriber.subscribe(entries)
+    assert [result["status"] for result in results] == ["invalid"] * 2
+    assert subscriber.subscribe([]) == []
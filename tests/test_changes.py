@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+from datetime import datetime
+
+from torweather.changes import Change
+from torweather.changes import Differ
+from torweather.changes import Event
+from torweather.schemas import RelayRecord
+
+fingerprint: str = "000A10D43011EA4928A35F610405F92B4433B4DC"
+
+
+def record(running: bool, version_status: str) -> RelayRecord:
+    return RelayRecord.from_onionoo(
+        {
+            "fingerprint": fingerprint,
+            "last_seen": datetime.utcnow().isoformat(" ", "seconds"),
+            "running": running,
+            "version_status": version_status,
+        },
+        ["fingerprint", "last_seen", "running", "version_status"],
+    )
+
+
+def test_diff():
+    differ = Differ(testing=True)
+    differ.collection.insert_one({"fingerprint": fingerprint, "email": "a@gmail.com"})
+    try:
+        # A new subscription is compared with a healthy relay.
+        events = differ.diff(
+            {fingerprint: record(False, "recommended")}, differ.states()
+        )
+        assert events == [Event(fingerprint, Change.WENT_DOWN)]
+        events = differ.diff(
+            {fingerprint: record(False, "recommended")}, differ.states()
+        )
+        assert events == []
+        events = differ.diff(
+            {fingerprint: record(True, "unrecommended")}, differ.states()
+        )
+        assert events == [
+            Event(fingerprint, Change.CAME_UP),
+            Event(fingerprint, Change.VERSION_OUTDATED),
+        ]
+    finally:
+        differ.collection.delete_one({"fingerprint": fingerprint})
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+import time
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+import requests  # type: ignore
+
+from torweather import check as check_module
+from torweather.check import Check
+from torweather.config import settings
+from torweather.schemas import RelayRecord
+from torweather.schemas import STATUS_FIELDS
+
+fingerprint: str = "000A10D43011EA4928A35F610405F92B4433B4DC"
+
+
+class Collection:
+    """Subscribers collection holding a relay which went down."""
+
+    def find(self, query, projection):
+        return [
+            {
+                "fingerprint": fingerprint,
+                "email": "myemail@gmail.com",
+                "NODE_DOWN": {"sent": False, "duration": 1},
+            }
+        ]
+
+
+def down() -> RelayRecord:
+    last_seen = datetime.utcnow() - timedelta(hours=3)
+    return RelayRecord.from_onionoo(
+        {
+            "fingerprint": fingerprint,
+            "last_seen": last_seen.isoformat(" ", "seconds"),
+            "running": False,
+            "version_status": "recommended",
+        },
+        STATUS_FIELDS,
+    )
+
+
+@pytest.fixture
+def check(monkeypatch) -> Check:
+    monkeypatch.setattr(check_module, "get_collection", Collection)
+    check = Check()
+    check.deadlines.schedule(fingerprint, time.time() - 1)
+    return check
+
+
+def assert_retried(check: Check) -> None:
+    deadline = check.deadlines.next()
+    assert fingerprint in check.deadlines and deadline is not None
+    assert deadline >= time.time() + settings.ONIONOO_POLL_INTERVAL - 60
+
+
+def test_deadline_fetch_error(check: Check, monkeypatch):
+    def fetch(fingerprints, fields=None):
+        raise requests.ConnectionError()
+
+    monkeypatch.setattr(check.snapshot, "fetch", fetch)
+    with pytest.raises(requests.ConnectionError):
+        check.deadline_check()
+    assert_retried(check)
+
+
+def test_deadline_relay_missing(check: Check, monkeypatch):
+    monkeypatch.setattr(check.snapshot, "fetch", lambda fingerprints, fields: {})
+    monkeypatch.setattr(settings, "DEADLINE_MAX_RETRIES", 2)
+    for _ in range(2):
+        check.deadline_check()
+        assert_retried(check)
+        check.deadlines.schedule(fingerprint, time.time() - 1)
+    # The relay is not looked up again once the retries are used up.
+    check.deadline_check()
+    assert fingerprint not in check.deadlines
+
+
+def test_deadline_details_missing(check: Check, monkeypatch):
+    # The status of the relay is found, but not its details.
+    def fetch(fingerprints, fields=None):
+        return {fingerprint: down()} if fields == STATUS_FIELDS else {}
+
+    monkeypatch.setattr(check.snapshot, "fetch", fetch)
+    check.deadline_check()
+    assert_retried(check)
@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+from torweather.deadlines import Deadlines
+
+
+def test_pop_due():
+    deadlines = Deadlines()
+    deadlines.schedule("A", 30)
+    deadlines.schedule("B", 10)
+    deadlines.schedule("C", 20)
+    assert deadlines.next() == 10
+    assert deadlines.pop_due(20) == ["B", "C"]
+    assert len(deadlines) == 1
+    assert deadlines.pop_due(20) == []
+
+
+def test_reschedule():
+    deadlines = Deadlines()
+    deadlines.schedule("A", 10)
+    deadlines.schedule("A", 40)
+    deadlines.schedule("B", 20)
+    deadlines.cancel("B")
+    assert deadlines.next() == 40
+    assert deadlines.pop_due(30) == []
+    assert deadlines.pop_due(40) == ["A"]
+    assert deadlines.next() is None
@@ -4,6 +4,7 @@ import pytest
 from torweather import Email
 from torweather import Notif
 from torweather import Relay
+from torweather.email import digest_message
 
 relay = Relay("000A10D43011EA4928A35F610405F92B4433B4DC", testing=True)
 notif_type = Notif.NODE_DOWN
@@ -12,7 +13,9 @@ notif_type = Notif.NODE_DOWN
 def test_valid_send():
     global relay, notif_type
     relay.subscribe("myemail@gmail.com", [notif_type])
-    result = Email(relay.data, "myemail@gmail.com", notif_type).send()
+    result = Email(
+        relay.data, "myemail@gmail.com", notif_type, duration=relay.duration
+    ).send()
     relay.unsubscribe()
     assert result == True
 
@@ -20,4 +23,16 @@ def test_valid_send():
 def test_invalid_send():
     global relay, notif_type
     with pytest.raises(Exception):
-        result = Email(relay.data, "myemail", notif_type).send()
+        result = Email(relay.data, "myemail", notif_type, duration=48).send()
+
+
+def test_digest_message():
+    message = digest_message(
+        "myemail@gmail.com",
+        [
+            ("[Tor Weather] Node down", "down"),
+            ("[Tor Weather] Node out of date", "old"),
+        ],
+    )
+    assert message["subject"] == "[Tor Weather] 2 notifications about your relays"
+    assert "Node down\n---------\ndown" in message.get_payload()
@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+import time
+
+from torweather.lease import Lease
+
+
+def test_acquire():
+    first = Lease("test", ttl=1, testing=True)
+    second = Lease("test", ttl=1, testing=True)
+    try:
+        assert first.acquire()
+        assert not second.acquire()
+        # Renewing a held lease succeeds.
+        assert first.acquire()
+        time.sleep(1.5)
+        assert second.acquire()
+        assert not first.acquire()
+        second.release()
+        assert first.acquire()
+    finally:
+        first.release()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import json
+import os
+import time
+
+import pytest
+import requests  # type: ignore
+
+from torweather.config import settings
+from torweather.onionoo import iter_json_array
+from torweather.onionoo import Onionoo
+
+
+def test_prune(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "ONIONOO_CACHE_MAX_AGE", 3600)
+    monkeypatch.setattr(settings, "ONIONOO_CACHE_MAX_ENTRIES", 2)
+    client = Onionoo(cache_directory=str(tmp_path))
+    now = time.time()
+    # Entries written 4 hours ago, then 3, 2 and 1 second ago.
+    for name, written in [("a", now - 4 * 3600), ("b", now - 3), ("c", now - 2)]:
+        for extension in ("json", "meta"):
+            path = tmp_path / f"{name}.{extension}"
+            path.write_text("{}")
+            os.utime(path, (written, written))
+    (tmp_path / "d.meta").write_text("{}")
+    assert client.prune() == 2
+    assert sorted(os.listdir(tmp_path)) == ["c.json", "c.meta", "d.meta"]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_iter_json_array(size: int):
+    document = json.dumps(
+        {"version": "8.0", "relays": [12, 3.5e2, "é", {"a": [1]}, True, None]}
+    ).encode()
+    chunks = [document[index : index + size] for index in range(0, len(document), size)]
+    assert list(iter_json_array(chunks, "relays")) == [
+        12,
+        350.0,
+        "é",
+        {"a": [1]},
+        True,
+        None,
+    ]
+
+
+def test_iter_json_array_split_number():
+    chunks = [b'{"relays": [12', b"34, 3.", b"5e", b"2]}"]
+    assert list(iter_json_array(chunks, "relays")) == [1234, 350.0]
+
+
+def test_iter_json_array_truncated():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"relays": [1, 2'], "relays"))
+
+
+class Response:
+    """Streamed response of a fake onionoo server."""
+
+    def __init__(self, status_code: int, body: bytes = b"", headers=None) -> None:
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self) -> "Response":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def iter_content(self, size: int):
+        for index in range(0, len(self.body), 5):
+            yield self.body[index : index + 5]
+
+
+def test_stream_not_modified(tmp_path, monkeypatch):
+    body = json.dumps({"relays": [{"fingerprint": "A"}, {"fingerprint": "B"}]})
+    last_modified = "Sun, 20 Mar 2022 10:00:00 GMT"
+    requests_headers = []
+    responses = [
+        Response(200, body.encode(), {"Last-Modified": last_modified}),
+        Response(304),
+    ]
+
+    def get(session, url, headers, stream):
+        requests_headers.append(headers)
+        return responses.pop(0)
+
+    monkeypatch.setattr(requests.Session, "get", get)
+    client = Onionoo(url="http://onionoo", cache_directory=str(tmp_path))
+    first = list(client.stream("details", "relays", type="relay"))
+    second = list(client.stream("details", "relays", type="relay"))
+    assert first == second == [{"fingerprint": "A"}, {"fingerprint": "B"}]
+    assert requests_headers == [{}, {"If-Modified-Since": last_modified}]
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+import threading
+import time
+
+from torweather import Email
+from torweather import Notif
+from torweather import Relay
+from torweather.outbox import Deliverer
+from torweather.outbox import Outbox
+from torweather.ratelimit import RateLimiter
+
+relay = Relay("000A10D43011EA4928A35F610405F92B4433B4DC", testing=True)
+outbox = Outbox(testing=True, max_attempts=2)
+
+
+def test_enqueue():
+    global relay, outbox
+    email = Email(relay.data, "myemail@gmail.com", Notif.OUTDATED_VER)
+    try:
+        assert outbox.enqueue([email]) == 1
+        # The same email is only stored once.
+        assert outbox.enqueue([email]) == 0
+    finally:
+        outbox.collection.delete_one({"_id": outbox.key(email)})
+
+
+def test_enqueue_incident():
+    global relay, outbox
+    first = Email(relay.data, "myemail@gmail.com", Notif.OUTDATED_VER)
+    second = Email(relay.data, "myemail@gmail.com", Notif.OUTDATED_VER, incident=1)
+    try:
+        assert outbox.enqueue([first]) == 1
+        # The email of the next incident is stored even with the same content.
+        assert outbox.enqueue([second]) == 1
+    finally:
+        outbox.collection.delete_many(
+            {"_id": {"$in": [outbox.key(first), outbox.key(second)]}}
+        )
+
+
+def test_retry():
+    global relay, outbox
+    email = Email(relay.data, "myemail@gmail.com", Notif.OUTDATED_VER)
+    outbox.enqueue([email])
+    try:
+        document = outbox.claim()
+        assert document["status"] == "sending"
+        outbox.retry(document, "error")
+        # The next attempt is delayed.
+        assert outbox.claim() is None
+        outbox.collection.update_one(
+            {"_id": document["_id"]}, {"$set": {"next_attempt": document["created"]}}
+        )
+        outbox.retry(outbox.claim(), "error")
+        assert outbox.collection.find_one({"_id": document["_id"]})["status"] == "dead"
+    finally:
+        outbox.collection.delete_one({"_id": outbox.key(email)})
+
+
+def test_claim_digest():
+    global relay, outbox
+    failed = Email(relay.data, "myemail@gmail.com", Notif.OUTDATED_VER)
+    new = Email(relay.data, "myemail@gmail.com", Notif.OUTDATED_VER, incident=1)
+    outbox.enqueue([failed])
+    try:
+        outbox.retry(outbox.claim(), "error")
+        outbox.enqueue([new])
+        documents = outbox.claim_digest(outbox.claim())
+        # The failed email waits for the end of its backoff.
+        assert [document["_id"] for document in documents] == [outbox.key(new)]
+        document = outbox.collection.find_one({"_id": outbox.key(failed)})
+        assert document["status"] == "pending" and document["attempts"] == 1
+    finally:
+        outbox.collection.delete_many(
+            {"_id": {"$in": [outbox.key(failed), outbox.key(new)]}}
+        )
+
+
+class Mailer:
+    def __init__(self) -> None:
+        self.messages = []
+
+    def send(self, message) -> None:
+        self.messages.append(message)
+
+    def close(self) -> None:
+        pass
+
+
+class Limiter(RateLimiter):
+    def __init__(self) -> None:
+        super().__init__([], [])
+        self.acquired = 0
+
+    def acquire(self, recipient: str) -> float:
+        # Slow enough for the other threads to claim emails meanwhile.
+        time.sleep(0.1)
+        self.acquired += 1
+        return super().acquire(recipient)
+
+
+def test_deliver_digest():
+    global relay, outbox
+    emails = [
+        Email(relay.data, "myemail@gmail.com", Notif.OUTDATED_VER, incident=incident)
+        for incident in range(6)
+    ]
+    outbox.enqueue(emails)
+    mailer, limiter = Mailer(), Limiter()
+    deliverer = Deliverer(outbox, mailer, limiter)  # type: ignore
+    try:
+        threads = [threading.Thread(target=deliverer.deliver) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The emails are sent as one digest, taking a single token.
+        assert len(mailer.messages) == 1
+        assert limiter.acquired == 1
+        assert outbox.collection.count_documents(
+            {"_id": {"$in": [outbox.key(email) for email in emails]}, "status": "sent"}
+        ) == len(emails)
+    finally:
+        outbox.collection.delete_many(
+            {"_id": {"$in": [outbox.key(email) for email in emails]}}
+        )
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+import time
+
+import pytest
+
+from torweather.ratelimit import parse_limits
+from torweather.ratelimit import RateLimiter
+from torweather.ratelimit import TokenBucket
+
+
+def test_parse_limits():
+    assert parse_limits("20/minute, 500/day") == [(20, 60.0), (500, 86400.0)]
+    assert parse_limits("") == []
+    with pytest.raises(ValueError):
+        parse_limits("20/week")
+
+
+def test_token_bucket():
+    bucket = TokenBucket(2, 10)
+    now = time.monotonic()
+    bucket.take(now)
+    bucket.take(now)
+    assert bucket.delay(now) == pytest.approx(5)
+    # Half the period refills half the bucket.
+    assert bucket.delay(now + 5) == 0
+
+
+def test_rate_limiter():
+    limiter = RateLimiter([(2, 60)], [(1, 60)])
+    assert limiter.acquire("a@gmail.com") == 0
+    # The domain has no token left, the server still has one.
+    assert limiter.acquire("b@gmail.com") > 0
+    assert limiter.acquire("c@riseup.net") == 0
+    assert limiter.delay() > 0
+
+
+def test_seed():
+    limiter = RateLimiter([(2, 60)], [])
+    # Two emails were sent by the previous process, one of them a minute ago.
+    limiter.seed([("a@gmail.com", 10), ("b@gmail.com", 60)])
+    assert limiter.delay() == 0
+    assert limiter.acquire("c@gmail.com") == 0
+    assert limiter.acquire("d@gmail.com") > 0
+    limiter.drain()
+    assert limiter.delay() == pytest.approx(30, rel=0.01)
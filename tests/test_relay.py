@@ -5,11 +5,13 @@ from typing import Tuple
 
 import pytest
 
+from torweather import InvalidFingerprintError
 from torweather import Notif
 from torweather import NotifNotSubscribedError
 from torweather import Relay
 from torweather import RelayNotSubscribedError
 from torweather import RelaySubscribedError
+from torweather.indexes import Indexes
 
 test_relays: Sequence[Tuple[str, Sequence[Notif], Mapping[str, str]]] = [
     (
@@ -24,6 +26,14 @@ test_relays: Sequence[Tuple[str, Sequence[Notif], Mapping[str, str]]] = [
     ),
 ]
 test_email: str = "myemail@gmail.com"
+# Subscribing a relay twice is rejected by the unique index on fingerprints.
+Indexes(testing=True).ensure()
+
+
+@pytest.mark.parametrize("fingerprint", ["seele", "000A10D4", "Z" * 40])
+def test_invalid_fingerprint(fingerprint: str):
+    with pytest.raises(InvalidFingerprintError):
+        Relay(fingerprint)
 
 
 @pytest.mark.parametrize("fingerprint, notifs, data", test_relays)
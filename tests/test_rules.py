@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+from typing import Optional
+
+from torweather.rules import evaluate
+from torweather.rules import node_down_deadlines
+from torweather.rules import Subscriptions
+from torweather.schemas import RelayRecord
+
+now = datetime(2022, 3, 20, 12, 0, 0)
+
+
+def record(
+    fingerprint: str, hours_down: int, version_status: Optional[str]
+) -> RelayRecord:
+    return RelayRecord(
+        nickname=fingerprint.lower(),
+        fingerprint=fingerprint,
+        last_seen=now - timedelta(hours=hours_down),
+        running=hours_down == 0,
+        consensus_weight=1,
+        last_restarted=now - timedelta(days=30),
+        bandwidth_rate=1,
+        effective_family=[fingerprint],
+        version_status=version_status,
+        recommended_version=version_status == "recommended",
+    )
+
+
+relays = {
+    "A": record("A", 0, "recommended"),
+    "B": record("B", 50, "unrecommended"),
+    "C": record("C", 10, "obsolete"),
+}
+documents = [
+    {
+        "fingerprint": "A",
+        "email": "a@gmail.com",
+        "NODE_DOWN": {"sent": False, "duration": 48},
+        "OUTDATED_VER": {"sent": False},
+    },
+    {
+        "fingerprint": "B",
+        "email": "b@gmail.com",
+        "NODE_DOWN": {"sent": False, "duration": 48},
+        "OUTDATED_VER": {"sent": False},
+    },
+    {
+        "fingerprint": "C",
+        "email": "c@gmail.com",
+        "NODE_DOWN": {"sent": True, "duration": 1},
+    },
+    {"fingerprint": "D", "email": "d@gmail.com", "OUTDATED_VER": {"sent": False}},
+]
+
+
+def test_subscriptions():
+    subscriptions = Subscriptions(documents, relays, ["NODE_DOWN", "OUTDATED_VER"])
+    assert len(subscriptions) == 3
+    assert subscriptions.missing == ["D"]
+    assert subscriptions.duration(0) == 48
+
+
+def test_evaluate():
+    subscriptions = Subscriptions(
+        documents, relays, ["NODE_DOWN", "OUTDATED_VER", "END_OF_LIFE_VER"]
+    )
+    due = evaluate(subscriptions, now)
+    assert due["NODE_DOWN"] == [1]
+    assert due["OUTDATED_VER"] == [1]
+    # END_OF_LIFE_VER is not subscribed by any relay.
+    assert due["END_OF_LIFE_VER"] == []
+
+
+def test_node_down_deadlines():
+    subscriptions = Subscriptions(documents, relays, ["NODE_DOWN"])
+    deadlines = node_down_deadlines(subscriptions)
+    timestamp = now.replace(tzinfo=timezone.utc).timestamp()
+    assert deadlines[1] < timestamp
+
+
+def test_no_version():
+    # A relay which reported no version has no version status.
+    subscriptions = Subscriptions(
+        documents[:1], {"A": record("A", 0, None)}, ["OUTDATED_VER"]
+    )
+    assert evaluate(subscriptions, now)["OUTDATED_VER"] == []
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+import requests  # type: ignore
+
+from torweather.onionoo import onionoo
+from torweather.snapshot import Snapshot
+
+
+def test_lookup(monkeypatch):
+    lookups = []
+
+    def get(document, **params):
+        lookups.append(params["lookup"])
+        if params["lookup"] == "bad":
+            response = requests.Response()
+            response.status_code = 400
+            raise requests.HTTPError(response=response)
+        relay = {"last_seen": "2022-03-20 12:00:00", "running": True}
+        return {"relays": [dict(relay, fingerprint=params["lookup"])]}
+
+    monkeypatch.setattr(onionoo, "get", get)
+    relays = Snapshot(lookup_threshold=3).fetch(
+        ["B" * 40, "A" * 40, "bad"], ["fingerprint"]
+    )
+    # Onionoo takes a single fingerprint per lookup.
+    assert sorted(lookups) == ["A" * 40, "B" * 40, "bad"]
+    assert sorted(relays) == ["A" * 40, "B" * 40]
+
+
+def test_optional_fields(monkeypatch):
+    relay = {"fingerprint": "A" * 40, "last_seen": "2022-03-20 12:00:00"}
+
+    def get(document, **params):
+        return {"relays": [dict(relay, running=False)]}
+
+    monkeypatch.setattr(onionoo, "get", get)
+    fields = ["fingerprint", "last_seen", "running", "version_status"]
+    relays = Snapshot(lookup_threshold=3).fetch(["A" * 40], fields)
+    # Onionoo leaves out version_status if the relay reported no version.
+    assert relays["A" * 40].version_status is None
+
+    def get_incomplete(document, **params):
+        return {"relays": [relay]}
+
+    monkeypatch.setattr(onionoo, "get", get_incomplete)
+    assert Snapshot(lookup_threshold=3).fetch(["A" * 40], fields) == {}
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+import time
+
+from torweather.check import Check
+from torweather.worker import Worker
+
+
+class Lease:
+    """Lease acquired on every attempt, which stops the worker once held."""
+
+    name = "test"
+    owner = "test"
+
+    def __init__(self) -> None:
+        self.worker: Worker
+
+    def acquire(self) -> bool:
+        self.worker.stop()
+        return True
+
+    def release(self) -> None:
+        pass
+
+
+class Deliverer:
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+def test_leader_resets_check(monkeypatch):
+    check = Check()
+    check.deadlines.schedule("000A10D43011EA4928A35F610405F92B4433B4DC", time.time())
+    monkeypatch.setattr("torweather.check.onionoo.published", lambda: "now")
+    monkeypatch.setattr(check, "hourly", lambda: None)
+    check.poll()
+    lease = Lease()
+    worker = Worker(check, lease, Deliverer())  # type: ignore
+    lease.worker = worker
+    worker.run()
+    # Deadlines of the previous term are dropped, and the next poll checks
+    # the relays even if onionoo did not publish new data.
+    assert len(check.deadlines) == 0
+    hourly = []
+    monkeypatch.setattr(check, "hourly", lambda: hourly.append(1))
+    check.poll()
+    assert hourly == [1]
@@ -6,13 +6,14 @@ from flask import Flask
 from flask import render_template
 from flask import request
 
-from torweather.check import Check
+from torweather.indexes import Indexes
+from torweather.routes.api import api
 from torweather.routes.subscribe import subscribe
 from torweather.routes.unsubscribe import unsubscribe
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
-Check().scheduler.start()
+Indexes().ensure()
 
 
 @app.route("/")
@@ -34,6 +35,7 @@ def internal_server_error(e):
 if __name__ == "__main__":
     app.register_blueprint(subscribe, url_prefix="/subscribe")
     app.register_blueprint(unsubscribe, url_prefix="/unsubscribe")
+    app.register_blueprint(api, url_prefix="/api")
     port = int(os.environ.get("PORT", 5000))
     # app.run(debug=True)
     app.run(host="0.0.0.0", port=port)
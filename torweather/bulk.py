@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Module for subscribing batches of relays to Tor Weather service, with one
+snapshot fetch and one bulk write for the whole batch."""
+from collections.abc import Mapping
+from collections.abc import MutableMapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from typing import Any
+from typing import Optional
+from typing import Tuple
+
+from email_validator import EmailNotValidError
+from email_validator import validate_email
+from pymongo.collection import Collection
+
+from torweather.database import get_collection
+from torweather.database import insert_ignoring_duplicates
+from torweather.logger import Logger
+from torweather.relay import FINGERPRINT
+from torweather.relay import subscription
+from torweather.schemas import Notif
+from torweather.snapshot import Snapshot
+
+# Fingerprint, email, notifications and NODE_DOWN duration of a subscription.
+Entry = Tuple[str, str, Sequence[Notif], int]
+
+
+class BulkSubscriber(Logger):
+    """Class for subscribing many relays at once, e.g. by provisioning tools.
+
+    Every entry is validated on its own, so an invalid entry does not fail the
+    others. The fingerprints of the valid entries are checked with a single
+    Snapshot fetch, the subscribed ones are found with a single query, and the
+    new ones are inserted with a single unordered bulk write.
+
+    Attributes:
+        testing (bool): Use a test database for executing functions.
+        snapshot (Optional[Snapshot]): Snapshot used for fetching the relays.
+    """
+
+    def __init__(
+        self, testing: bool = False, snapshot: Optional[Snapshot] = None
+    ) -> None:
+        """Initializes the BulkSubscriber class with the subscribers collection
+        and a custom logger."""
+        super().__init__(__name__)
+        self.snapshot = snapshot or Snapshot()
+        self.__collection = get_collection(testing=testing)
+        # Whether the domain of an email accepts emails, checked once per
+        # domain instead of once per entry.
+        self.__domains: MutableMapping[str, bool] = {}
+
+    @property
+    def collection(self) -> Collection:
+        """Returns the MongoDB collection object."""
+        return self.__collection
+
+    def __validate_email(self, email: Any) -> str:
+        """Validate the syntax of an email and the DNS records of its domain.
+
+        Raises:
+            ValueError: Email is not valid.
+        """
+        if not isinstance(email, str):
+            raise ValueError("Not a valid email address.")
+        try:
+            domain = validate_email(email, check_deliverability=False).domain
+            if domain not in self.__domains:
+                try:
+                    validate_email(email)
+                    self.__domains[domain] = True
+                except EmailNotValidError:
+                    self.__domains[domain] = False
+        except EmailNotValidError:
+            raise ValueError("Not a valid email address.")
+        if not self.__domains[domain]:
+            raise ValueError("Not a valid email address.")
+        return email
+
+    def __parse(self, entry: Any) -> Entry:
+        """Parse an entry of the form {"fingerprint": str, "email": str,
+        "notifs": [str], "duration": int}, where "duration" is optional.
+
+        Raises:
+            ValueError: Entry is not valid.
+
+        Returns:
+            Entry: Fingerprint, email, notifications and NODE_DOWN duration.
+        """
+        if not isinstance(entry, Mapping):
+            raise ValueError("Not a subscription object.")
+        fingerprint = entry.get("fingerprint")
+        if not isinstance(fingerprint, str) or not FINGERPRINT.fullmatch(
+            fingerprint.upper()
+        ):
+            raise ValueError("Not a valid relay fingerprint.")
+        email = self.__validate_email(entry.get("email"))
+        names = entry.get("notifs")
+        if not isinstance(names, list) or not names:
+            raise ValueError("Choose at least one notification to subscribe.")
+        notifs: MutableSequence[Notif] = []
+        for name in names:
+            # Names are accepted as in the forms, e.g. "node-down".
+            member = (
+                Notif.__members__.get(name.replace("-", "_").upper())
+                if isinstance(name, str)
+                else None
+            )
+            if member is None:
+                raise ValueError(f"Not a valid notification: {name!r}.")
+            if member not in notifs:
+                notifs.append(member)
+        duration = entry.get("duration", 48)
+        if not isinstance(duration, int) or isinstance(duration, bool) or duration < 0:
+            raise ValueError("Not a valid duration.")
+        return fingerprint.upper(), email, notifs, duration
+
+    def subscribe(self, entries: Sequence[Any]) -> Sequence[Mapping[str, Any]]:
+        """Subscribe a batch of relays to the Tor weather service.
+
+        Args:
+            entries (Sequence[Any]): Subscriptions, see `__parse` for their form.
+
+        Returns:
+            Sequence[Mapping[str, Any]]: Result of every entry, in order, with
+                its "fingerprint", a "status" among "subscribed", "exists" and
+                "invalid", the "nickname" of valid relays, and an "error"
+                message for invalid entries.
+        """
+        results: MutableSequence[MutableMapping[str, Any]] = []
+        valid: MutableMapping[str, Tuple[int, Entry]] = {}
+        for index, entry in enumerate(entries):
+            fingerprint = (
+                entry.get("fingerprint") if isinstance(entry, Mapping) else None
+            )
+            results.append({"fingerprint": fingerprint})
+            try:
+                parsed = self.__parse(entry)
+            except ValueError as error:
+                results[index].update(status="invalid", error=str(error))
+                continue
+            results[index]["fingerprint"] = parsed[0]
+            if parsed[0] in valid:
+                results[index].update(
+                    status="invalid", error="Relay fingerprint given more than once."
+                )
+                continue
+            valid[parsed[0]] = (index, parsed)
+        if not valid:
+            return results
+        relays = self.snapshot.fetch(valid.keys(), ["fingerprint", "nickname"])
+        for fingerprint in valid.keys() - relays.keys():
+            results[valid.pop(fingerprint)[0]].update(
+                status="invalid", error="Not a valid relay fingerprint."
+            )
+        for index, (fingerprint, *_) in valid.values():
+            results[index]["nickname"] = relays[fingerprint].nickname
+        for document in self.collection.find(
+            {"fingerprint": {"$in": list(valid)}}, {"_id": 0, "fingerprint": 1}
+        ):
+            results[valid.pop(document["fingerprint"])[0]]["status"] = "exists"
+        for index, _ in valid.values():
+            results[index]["status"] = "subscribed"
+        # A relay subscribed in the meantime is left as it is.
+        for document in insert_ignoring_duplicates(
+            self.collection, [subscription(*entry) for _, entry in valid.values()]
+        ):
+            results[valid[document["fingerprint"]][0]]["status"] = "exists"
+        subscribed = sum(result["status"] == "subscribed" for result in results)
+        self.logger.info(f"{subscribed} of {len(results)} relays subscribed in bulk.")
+        return results
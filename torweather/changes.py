@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+"""Module for detecting the changes of subscribed relays between two syncs of
+the snapshot, so that checks only evaluate the relays which changed."""
+import enum
+from collections.abc import Mapping
+from collections.abc import MutableMapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from torweather.config import settings
+from torweather.database import get_collection
+from torweather.logger import Logger
+from torweather.schemas import Notif
+from torweather.schemas import RelayRecord
+
+# Running status and version status of a relay.
+State = Tuple[bool, Optional[str]]
+
+
+class Change(enum.Enum):
+    """Enum for changes of a relay between two syncs."""
+
+    WENT_DOWN = "went down"
+    CAME_UP = "came up"
+    VERSION_OUTDATED = "version became unrecommended"
+    VERSION_OBSOLETE = "version became obsolete"
+    VERSION_UPDATED = "version became supported"
+
+
+class Event(NamedTuple):
+    """Change of a relay."""
+
+    fingerprint: str
+    change: Change
+
+
+# Notification types to evaluate for a relay after a change.
+TRIGGERS: Mapping[Change, str] = {
+    Change.WENT_DOWN: "NODE_DOWN",
+    Change.VERSION_OUTDATED: "OUTDATED_VER",
+    Change.VERSION_OBSOLETE: "END_OF_LIFE_VER",
+}
+# Notifications to send again when a relay recovers from the change.
+RECOVERIES: Mapping[Change, Sequence[Notif]] = {
+    Change.CAME_UP: [Notif.NODE_DOWN],
+    Change.VERSION_UPDATED: [Notif.OUTDATED_VER],
+}
+
+
+def version_change(version_status: Optional[str]) -> Optional[Change]:
+    """Returns the version change of a relay reaching a version status, None
+    if the relay reported no version."""
+    if version_status is None:
+        return None
+    if version_status == "unrecommended":
+        return Change.VERSION_OUTDATED
+    if version_status == "obsolete":
+        return Change.VERSION_OBSOLETE
+    return Change.VERSION_UPDATED
+
+
+class Differ(Logger):
+    """Class for comparing the relays of a snapshot with their state at the
+    previous sync, which is stored in the `relay_state` field of subscriber
+    documents. Storing it with the subscription means that a new subscription
+    has no previous state, so it is compared with a running relay with a
+    supported version, and its current problems are reported as changes.
+
+    Only the running and version status are stored, so that a sync writes
+    to the documents of the relays which changed. The last seen time of a
+    running relay changes on every sync.
+
+    Attributes:
+        testing (bool): Use a test database for executing functions.
+    """
+
+    def __init__(self, testing: bool = False) -> None:
+        """Initializes the Differ class with the subscribers collection and a
+        custom logger."""
+        super().__init__(__name__)
+        self.__collection = get_collection(testing=testing)
+
+    @property
+    def collection(self) -> Collection:
+        """Returns the MongoDB collection object."""
+        return self.__collection
+
+    def states(self) -> Mapping[str, Optional[State]]:
+        """Returns the state of every subscribed relay at the previous sync.
+
+        Returns:
+            Mapping[str, Optional[State]]: Fingerprint to state map, the state
+                is None for relays subscribed since the previous sync.
+        """
+        states: MutableMapping[str, Optional[State]] = {}
+        for document in self.collection.find(
+            {}, {"_id": 0, "fingerprint": 1, "relay_state": 1}
+        ):
+            state = document.get("relay_state")
+            states[document["fingerprint"]] = (
+                (state["running"], state["version_status"]) if state else None
+            )
+        return states
+
+    def diff(
+        self,
+        relays: Mapping[str, RelayRecord],
+        states: Mapping[str, Optional[State]],
+    ) -> Sequence[Event]:
+        """Compare relays with their previous state and store their new state.
+        Relays missing from the snapshot keep their previous state.
+
+        Args:
+            relays (Mapping[str, RelayRecord]): Fingerprint to relay data map,
+                with at least the fields in STATUS_FIELDS.
+            states (Mapping[str, Optional[State]]): States returned by `states`.
+
+        Returns:
+            Sequence[Event]: Changes of the relays.
+        """
+        events: MutableSequence[Event] = []
+        operations: MutableSequence[UpdateOne] = []
+        for fingerprint, relay in relays.items():
+            if fingerprint not in states:
+                continue
+            state: State = (relay.running, relay.version_status)
+            previous = states[fingerprint] or (True, "recommended")
+            if states[fingerprint] == state:
+                continue
+            if relay.running != previous[0]:
+                events.append(
+                    Event(
+                        fingerprint,
+                        Change.CAME_UP if relay.running else Change.WENT_DOWN,
+                    )
+                )
+            change = version_change(relay.version_status)
+            if change is not None and change != version_change(previous[1]):
+                events.append(Event(fingerprint, change))
+            operations.append(
+                UpdateOne(
+                    {"fingerprint": fingerprint},
+                    {
+                        "$set": {
+                            "relay_state": {
+                                "running": relay.running,
+                                "version_status": relay.version_status,
+                            }
+                        }
+                    },
+                )
+            )
+        self.__write(operations)
+        self.logger.info(
+            f"{len(events)} changes of {len(operations)} relays since the previous sync."
+        )
+        return events
+
+    def __write(self, operations: Sequence[UpdateOne]) -> None:
+        """Write the states in batches of bulk writes."""
+        batch_size = settings.BULK_WRITE_BATCH_SIZE
+        for start in range(0, len(operations), batch_size):
+            try:
+                self.collection.bulk_write(
+                    operations[start : start + batch_size],
+                    ordered=settings.BULK_WRITE_ORDERED,
+                )
+            except BulkWriteError as error:
+                self.logger.error(
+                    f"Unable to store relay states: {error.details.get('writeErrors')}"
+                )
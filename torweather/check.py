@@ -1,39 +1,356 @@
 #!/usr/bin/env python
 """Module for checking relay data, sending emails and upating notification status
 in the background using apscheduler."""
+import math
+import threading
+import time
+from collections.abc import Collection
+from collections.abc import Mapping
+from collections.abc import MutableMapping
+from collections.abc import MutableSequence
+from collections.abc import MutableSet
 from collections.abc import Sequence
+from collections.abc import Set
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from typing import Optional
+from typing import Tuple
 
+import requests  # type: ignore
 from apscheduler.schedulers.background import BackgroundScheduler
-from pymongo import MongoClient
 
-from torweather.config import secrets
+from torweather.changes import Change
+from torweather.changes import Differ
+from torweather.changes import RECOVERIES
+from torweather.changes import TRIGGERS
+from torweather.config import settings
+from torweather.database import get_collection
+from torweather.database import StatusWriter
+from torweather.deadlines import Deadlines
 from torweather.email import Email
-from torweather.relay import Relay
+from torweather.logger import Logger
+from torweather.onionoo import onionoo
+from torweather.outbox import Outbox
+from torweather.rules import evaluate
+from torweather.rules import node_down_deadlines
+from torweather.rules import Subscriptions
 from torweather.schemas import Notif
-from torweather.utils import node_down_duration
+from torweather.schemas import RelayRecord
+from torweather.schemas import STATUS_FIELDS
+from torweather.snapshot import Snapshot
 
 
-class Check:
-    """Class for checking and updating relay notification status."""
+class Check(Logger):
+    """Class for checking and updating relay notification status.
+
+    A NODE_DOWN notification becomes due at a known time, `duration` hours
+    after the relay was last seen. Hourly checks keep these deadlines in a
+    priority queue, and the relays of a deadline are checked again as soon as
+    it passes, with fresh relay data. A relay seen again in the meantime gets
+    a new deadline instead of a notification.
+
+    Every sync of the snapshot is compared with the previous one. Checks only
+    evaluate the relays which changed since the previous check of the same
+    notification types, except the first check after starting, which
+    evaluates every relay. Notifications of relays which recovered are
+    re-armed, so that they are sent again on the next incident.
+
+    Hourly checks follow the publications of onionoo instead of the clock:
+    the publication time is polled every few minutes, and a check runs as
+    soon as new relay data is published, once per publication.
+    """
 
     def __init__(self):
-        """Initializes Check class with a BackgroundScheduler object."""
+        """Initializes Check class with a BackgroundScheduler object and a
+        snapshot of relay data shared by every check."""
+        super().__init__(__name__)
+        self.__snapshot = Snapshot()
+        self.__deadlines = Deadlines()
+        # Retries of the deadlines of relays missing from onionoo.
+        self.__retries: MutableMapping[str, int] = {}
+        self.__differ = Differ()
+        self.__outbox = Outbox()
+        # Relays changed since the previous check of a notification type, None
+        # until the type is checked for every relay.
+        self.__changed: MutableMapping[str, Optional[MutableSet[str]]] = {}
+        self.__lock = threading.Lock()
+        self.__published: Optional[str] = None
         self.__scheduler = BackgroundScheduler(daemon=True)
-        self.scheduler.add_job(self.hourly, trigger="interval", minutes=60)
-        self.scheduler.add_job(self.daily, trigger="cron", hour=0)
-        self.scheduler.add_job(self.monthly, trigger="cron", day="last")
+        # A check still running when its next run is due is not started
+        # again, the missed run is skipped instead.
+        job_options = {"max_instances": 1, "coalesce": True}
+        self.scheduler.add_job(
+            self.poll,
+            trigger="interval",
+            seconds=settings.ONIONOO_POLL_INTERVAL,
+            **job_options,
+        )
+        self.scheduler.add_job(self.daily, trigger="cron", hour=0, **job_options)
+        self.scheduler.add_job(self.monthly, trigger="cron", day="last", **job_options)
 
     @property
     def scheduler(self):
         """Returns the scheduler object."""
         return self.__scheduler
 
-    def hourly(self) -> None:
-        """Hourly checks of subscribed relays."""
+    @property
+    def snapshot(self) -> Snapshot:
+        """Returns the snapshot of relay data."""
+        return self.__snapshot
+
+    @property
+    def deadlines(self) -> Deadlines:
+        """Returns the deadlines of NODE_DOWN notifications."""
+        return self.__deadlines
+
+    @property
+    def outbox(self) -> Outbox:
+        """Returns the outbox of emails to send."""
+        return self.__outbox
+
+    @property
+    def differ(self) -> Differ:
+        """Returns the differ of relay states."""
+        return self.__differ
+
+    def reset(self) -> None:
+        """Forget the changes and deadlines recorded so far, which are stale
+        once another process ran the checks in the meantime. The next poll
+        checks every relay, which sets the deadlines again."""
+        with self.__lock:
+            self.__changed.clear()
+            self.__published = None
+        self.deadlines.clear()
+        self.__retries.clear()
+        self.__arm()
+
+    def __sync(self) -> Mapping[str, RelayRecord]:
+        """Sync the snapshot with the status of every subscribed relay and
+        record the changes since the previous sync."""
+        with self.__lock:
+            states = self.differ.states()
+            relays = self.snapshot.sync(states.keys(), fields=STATUS_FIELDS)
+            events = self.differ.diff(relays, states)
+            with StatusWriter() as writer:
+                for fingerprint, change in events:
+                    for notif in RECOVERIES.get(change, []):
+                        writer.update_notif_status(fingerprint, notif, status=False)
+                    if change is Change.CAME_UP:
+                        self.deadlines.cancel(fingerprint)
+                    changed = self.__changed.get(TRIGGERS.get(change, ""))
+                    if changed is not None:
+                        changed.add(fingerprint)
+        return relays
 
-        client = MongoClient(secrets.MONGODB_URI)
-        database = client["torweather"]
-        collection = database["subscribers"]
+    def __pending(self, notif_types: Sequence[str]) -> Optional[Set[str]]:
+        """Returns the relays changed since the previous check of the
+        notification types, None if every relay has to be evaluated."""
+        with self.__lock:
+            changed = [self.__changed.get(notif) for notif in notif_types]
+            for notif in notif_types:
+                self.__changed[notif] = set()
+        pending: MutableSet[str] = set()
+        for fingerprints in changed:
+            if fingerprints is None:
+                return None
+            pending |= fingerprints
+        return pending
+
+    def __run(
+        self, notif_types: Sequence[str]
+    ) -> Tuple[Subscriptions, Mapping[str, Sequence[int]]]:
+        """Sync the snapshot and check the relays changed since the previous
+        check of the notification types."""
+        relays = self.__sync()
+        fingerprints = self.__pending(notif_types)
+        try:
+            return self.__check(notif_types, relays, fingerprints)
+        except:
+            # The changes are lost, so the next check evaluates every relay.
+            with self.__lock:
+                for notif in notif_types:
+                    self.__changed[notif] = None
+            raise
+
+    def __check(
+        self,
+        notif_types: Sequence[str],
+        relays: Mapping[str, RelayRecord],
+        fingerprints: Optional[Collection[str]] = None,
+    ) -> Tuple[Subscriptions, Mapping[str, Sequence[int]]]:
+        """Evaluate the rules of the notification types over every pending
+        subscription and queue the emails of those which are due.
+
+        The collection is scanned once per check, whatever the number of
+        notification types: a single cursor returns every document with at
+        least one of them pending, projected to the fields the rules need.
+        Likewise, only the fields needed by the rules are fetched for every
+        subscribed relay, and the details rendered in emails are fetched for
+        the relays with a notification due, which are few in most checks.
+
+        Args:
+            notif_types (Sequence[str]): Notification types to evaluate.
+            relays (Mapping[str, RelayRecord]): Fingerprint to relay data map,
+                with at least the fields in STATUS_FIELDS.
+            fingerprints (Optional[Collection[str]]): Only check these relays.
+                Defaults to None, which checks every subscribed relay.
+
+        Returns:
+            Tuple[Subscriptions, Mapping[str, Sequence[int]]]: Evaluated
+                subscriptions and the indexes of those which were due and
+                queued.
+        """
+        query: dict[str, Any] = {
+            "$or": [{f"{notif}.sent": False} for notif in notif_types]
+        }
+        if fingerprints is not None:
+            query["fingerprint"] = {"$in": list(fingerprints)}
+        cursor = get_collection().find(
+            query,
+            {"_id": 0, "fingerprint": 1, "email": 1, **dict.fromkeys(notif_types, 1)},
+        )
+        subscriptions = Subscriptions(cursor, relays, notif_types)
+        for fingerprint in subscriptions.missing:
+            self.logger.warning(f"Relay {fingerprint} not found in onionoo snapshot.")
+        due = evaluate(subscriptions)
+        candidates = {
+            subscriptions.fingerprints[index]
+            for indexes in due.values()
+            for index in indexes
+        }
+        if not candidates:
+            return subscriptions, due
+        details = self.snapshot.fetch(candidates)
+        emails: MutableSequence[Email] = []
+        queued: MutableMapping[str, MutableSequence[int]] = {}
+        for notif, indexes in due.items():
+            queued[notif] = []
+            for index in indexes:
+                fingerprint = subscriptions.fingerprints[index]
+                if fingerprint not in details:
+                    self.logger.warning(
+                        f"Relay {fingerprint} not found in onionoo details."
+                    )
+                    continue
+                queued[notif].append(index)
+                # getattr(Notif, notif) is used to create the enum type of Notif
+                # using the notification type stored in database.
+                emails.append(
+                    Email(
+                        details[fingerprint],
+                        subscriptions.emails[index],
+                        getattr(Notif, notif),
+                        duration=subscriptions.duration(index),
+                        incident=subscriptions.incident(index, notif),
+                    )
+                )
+        # Emails are sent by the delivery threads of the workers. Once stored in
+        # the outbox, a notification is delivered or dead-lettered, so it is
+        # marked as sent.
+        stored = self.outbox.enqueue(emails)
+        with StatusWriter() as writer:
+            for email in emails:
+                writer.update_notif_status(email.relay.fingerprint, email.type)
+        self.logger.info(f"Queued {stored} of {len(emails)} emails in the outbox.")
+        return subscriptions, queued
+
+    def __schedule(
+        self, subscriptions: Subscriptions, due: Mapping[str, Sequence[int]]
+    ) -> None:
+        """Set the deadlines of the pending NODE_DOWN notifications which were
+        not queued. A notification which was due but could not be queued, e.g.
+        as the details of its relay were missing, is checked again later.
+        Running relays get no deadline, as they are evaluated again by the
+        WENT_DOWN change when they stop running."""
+        if "NODE_DOWN" in subscriptions.notif_types:
+            sent = set(due.get("NODE_DOWN", []))
+            pending = subscriptions.pending["NODE_DOWN"]
+            now = time.time()
+            for index, deadline in enumerate(node_down_deadlines(subscriptions)):
+                if subscriptions.running[index]:
+                    continue
+                if pending[index] and index not in sent and math.isfinite(deadline):
+                    if deadline <= now:
+                        deadline = now + settings.ONIONOO_POLL_INTERVAL
+                    self.deadlines.schedule(subscriptions.fingerprints[index], deadline)
+        self.__arm()
+
+    def __arm(self) -> None:
+        """Schedule a check of the relays at the earliest deadline."""
+        deadline = self.deadlines.next()
+        if deadline is None:
+            if self.scheduler.get_job("node_down_deadline"):
+                self.scheduler.remove_job("node_down_deadline")
+            return
+        self.scheduler.add_job(
+            self.deadline_check,
+            trigger="date",
+            run_date=datetime.fromtimestamp(deadline, timezone.utc),
+            id="node_down_deadline",
+            replace_existing=True,
+            # A deadline is never skipped, even if the check runs late.
+            misfire_grace_time=None,
+        )
+
+    def deadline_check(self) -> None:
+        """Check the relays whose NODE_DOWN deadline has passed. Hourly checks
+        only evaluate relays which changed, so a relay which stays down is only
+        notified by its deadline, which is never dropped before the relay is
+        checked."""
+        fingerprints = self.deadlines.pop_due(time.time())
+        if not fingerprints:
+            self.__arm()
+            return
+        retry = time.time() + settings.ONIONOO_POLL_INTERVAL
+        try:
+            relays = self.snapshot.fetch(fingerprints, fields=STATUS_FIELDS)
+            subscriptions, due = self.__check(["NODE_DOWN"], relays, fingerprints)
+        except:
+            # The deadlines are retried, and the next hourly check evaluates
+            # every relay.
+            for fingerprint in fingerprints:
+                self.deadlines.schedule(fingerprint, retry)
+            with self.__lock:
+                self.__changed["NODE_DOWN"] = None
+            self.__arm()
+            raise
+        for fingerprint in subscriptions.fingerprints:
+            self.__retries.pop(fingerprint, None)
+        for fingerprint in subscriptions.missing:
+            retries = self.__retries.get(fingerprint, 0)
+            if retries >= settings.DEADLINE_MAX_RETRIES:
+                # Onionoo stopped listing the relay, which is not seen again.
+                del self.__retries[fingerprint]
+                self.logger.warning(
+                    f"Dropping the NODE_DOWN deadline of relay {fingerprint}, "
+                    "which is missing from onionoo."
+                )
+                continue
+            self.__retries[fingerprint] = retries + 1
+            self.deadlines.schedule(fingerprint, retry)
+        self.__schedule(subscriptions, due)
+
+    def poll(self) -> None:
+        """Run the hourly checks if onionoo published new relay data since
+        the previous check."""
+        try:
+            published = onionoo.published()
+        except requests.RequestException as error:
+            self.logger.error(f"Unable to get the publication time of onionoo: {error}")
+            return
+        if published is not None and published == self.__published:
+            return
+        self.logger.info(f"Relay data published at {published}, checking relays.")
+        self.hourly()
+        # Only set after a successful check, so a failed one runs again on the
+        # next poll.
+        self.__published = published
+
+    def hourly(self) -> None:
+        """Hourly checks of subscribed relays, run by `poll` when onionoo
+        publishes new relay data. They also renew the deadlines of NODE_DOWN
+        notifications with the new data."""
         notif_types: Sequence[str] = [
             "NODE_DOWN",
             # "SECURITY_VULNERABILITY",
@@ -42,50 +359,21 @@ class Check:
             # "DETECT_ISSUES",
             # "REQUIREMENTS",
         ]
-        for notif in notif_types:
-            cursor = collection.find({f"{notif}.sent": False})
-            for data in cursor:
-                relay = Relay(data["fingerprint"])
-                if notif == "NODE_DOWN":
-                    if node_down_duration(relay.data) > data[notif]["duration"]:
-                        # getattr(Notif, notif) is used to create the enum type of Notif
-                        # using the notification type stored in database.
-                        Email(relay.data, data["email"], getattr(Notif, notif)).send()
-                        relay.update_notif_status(getattr(Notif, notif))
-                else:
-                    Email(relay.data, data["email"], getattr(Notif, notif)).send()
-                    relay.update_notif_status(getattr(Notif, notif))
+        self.__schedule(*self.__run(notif_types))
 
     def daily(self) -> None:
         """Daily checks of subscribed relays."""
-
-        client = MongoClient(secrets.MONGODB_URI)
-        database = client["torweather"]
-        collection = database["subscribers"]
         notif_types: Sequence[str] = [
             "OUTDATED_VER",
             # "END_OF_LIFE_VER",
             # "OPERATOR_EVENTS",
         ]
-        for notif in notif_types:
-            cursor = collection.find({f"{notif}.sent": False})
-            for data in cursor:
-                relay = Relay(data["fingerprint"])
-                if notif == "OUTDATED_VER":
-                    if relay.data.version_status == "unrecommended":
-                        Email(relay.data, data["email"], getattr(Notif, notif)).send()
-                        relay.update_notif_status(getattr(Notif, notif))
-                elif notif == "END_OF_LIFE_VER":
-                    if relay.data.version_status == "obsolete":
-                        Email(relay.data, data["email"], getattr(Notif, notif)).send()
-                        relay.update_notif_status(getattr(Notif, notif))
+        self.__run(notif_types)
 
     def monthly(self) -> None:
         """Monthly checks of subscribed relays."""
 
-        client = MongoClient(secrets.MONGODB_URI)
-        database = client["torweather"]
-        collection = database["subscribers"]
+        collection = get_collection()
         notif_types: Sequence[str] = [
             # "TOP_LIST",
             # "DATA",
@@ -10,9 +10,83 @@ class Secrets(BaseSettings):
     EMAIL: str
     PASSWORD: str
     MONGODB_URI: str
+    # Bearer token required by the JSON API, which is disabled if empty.
+    API_TOKEN: str = ""
+
+    class Config:
+        env_file = ".env"
+
+
+class Settings(BaseSettings):
+    """Class for parsing and validating optional tuning parameters
+    from `.env` file. Every setting has a default value."""
+
+    ONIONOO_URL: str = "https://onionoo.torproject.org"
+    # Directory for storing onionoo responses, relative to the project
+    # directory if not absolute.
+    ONIONOO_CACHE_DIR: str = "cache"
+    # Responses cached on disk are removed after ONIONOO_CACHE_MAX_AGE seconds,
+    # and the oldest ones beyond ONIONOO_CACHE_MAX_ENTRIES responses.
+    ONIONOO_CACHE_MAX_AGE: int = 86400
+    ONIONOO_CACHE_MAX_ENTRIES: int = 1000
+    # Seconds for which a Relay object reuses its fetched relay data.
+    RELAY_DATA_TTL: int = 300
+    # Checks of at most this many subscribed relays look them up, with one
+    # request per relay, instead of downloading every relay of the network.
+    ONIONOO_LOOKUP_THRESHOLD: int = 100
+    # Lookup requests sent concurrently.
+    ONIONOO_LOOKUP_WORKERS: int = 8
+    # Seconds between two requests for the publication time of relay data.
+    ONIONOO_POLL_INTERVAL: int = 300
+    # Times a NODE_DOWN deadline is retried while its relay is missing from
+    # onionoo, which only lists relays seen in the past week.
+    DEADLINE_MAX_RETRIES: int = 12
+    # Connection pool of the MongoDB client shared by a process.
+    MONGODB_MAX_POOL_SIZE: int = 20
+    MONGODB_CONNECT_TIMEOUT_MS: int = 10000
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 10000
+    MONGODB_SOCKET_TIMEOUT_MS: int = 30000
+    # Notification status updates written per bulk write after a check.
+    BULK_WRITE_BATCH_SIZE: int = 1000
+    BULK_WRITE_ORDERED: bool = False
+    # Maximum number of subscriptions in a request to the JSON API.
+    API_MAX_BATCH_SIZE: int = 5000
+    # SMTP sessions are kept open and reused for many emails.
+    SMTP_SERVER: str = "smtp.gmail.com"
+    SMTP_PORT: int = 465
+    SMTP_POOL_SIZE: int = 2
+    SMTP_MAX_MESSAGES_PER_SESSION: int = 100
+    SMTP_TIMEOUT: int = 30
+    # Emails sent over the SMTP server and to every recipient domain, as comma
+    # separated <count>/<second|minute|hour|day> limits.
+    MAIL_RATE_LIMITS: str = "20/minute,500/day"
+    MAIL_DOMAIN_RATE_LIMITS: str = "10/minute"
+    # Seconds for which queued emails wait for other emails to the same
+    # address, to be sent together as one digest. New emails already queued
+    # for the address are always combined.
+    DIGEST_WINDOW: int = 0
+    # Threads of a worker sending the emails of the outbox.
+    OUTBOX_WORKERS: int = 4
+    # Seconds between two checks of an empty outbox.
+    OUTBOX_POLL_INTERVAL: int = 5
+    # Seconds for which a sending thread holds an email before another can
+    # claim it.
+    OUTBOX_LOCK_TIMEOUT: int = 300
+    # Failed emails are retried after OUTBOX_BACKOFF seconds, doubled on every
+    # attempt, and dead-lettered after OUTBOX_MAX_ATTEMPTS attempts.
+    OUTBOX_BACKOFF: int = 60
+    OUTBOX_MAX_BACKOFF: int = 3600
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    # Seconds for which sent emails are kept in the outbox.
+    OUTBOX_RETENTION: int = 604800
+    # Seconds for which a worker holds the scheduler lease, and between two
+    # renewals of it.
+    LEASE_TTL: int = 30
+    LEASE_RENEW_INTERVAL: int = 10
 
     class Config:
         env_file = ".env"
 
 
 secrets = Secrets()
+settings = Settings()
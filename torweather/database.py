@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""Module for sharing a single pooled MongoDB client between torweather
+modules and writing to the database in bulk."""
+import os
+import threading
+from collections.abc import Mapping
+from collections.abc import MutableMapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from typing import Any
+from typing import Optional
+
+from pymongo import MongoClient
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from torweather.config import secrets
+from torweather.config import settings
+from torweather.logger import Logger
+from torweather.schemas import Notif
+
+# Error code of MongoDB for a duplicate key.
+DUPLICATE_KEY = 11000
+_client: Optional[MongoClient] = None
+_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    """Returns the MongoDB client of the current process, creating it on first
+    use. A MongoClient must not be used across a fork, so a forked process
+    (e.g. a WSGI worker) creates its own client.
+
+    Returns:
+        MongoClient: Pooled MongoDB client.
+    """
+    global _client, _pid
+    with _lock:
+        if _client is None or _pid != os.getpid():
+            _client = MongoClient(
+                secrets.MONGODB_URI,
+                maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+                connectTimeoutMS=settings.MONGODB_CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+                socketTimeoutMS=settings.MONGODB_SOCKET_TIMEOUT_MS,
+                connect=False,
+            )
+            _pid = os.getpid()
+        return _client
+
+
+def get_collection(name: str = "subscribers", testing: bool = False) -> Collection:
+    """Returns a collection of the torweather database.
+
+    Args:
+        name (str, optional): Name of the collection. Defaults to "subscribers".
+        testing (bool, optional): Use the test database. Defaults to False.
+
+    Returns:
+        Collection: MongoDB collection object.
+    """
+    client = get_client()
+    database = client["testtorweather"] if testing else client["torweather"]
+    return database[name]
+
+
+def insert_ignoring_duplicates(
+    collection: Collection, documents: Sequence[Mapping[str, Any]]
+) -> Sequence[Mapping[str, Any]]:
+    """Insert documents with a single unordered `insert_many`, leaving out the
+    documents whose key is already in the collection.
+
+    Args:
+        collection (Collection): MongoDB collection to insert into.
+        documents (Sequence[Mapping[str, Any]]): Documents to insert.
+
+    Raises:
+        BulkWriteError: A document failed to insert for another reason.
+
+    Returns:
+        Sequence[Mapping[str, Any]]: Documents which were not inserted as
+            duplicates.
+    """
+    if not documents:
+        return []
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as error:
+        errors = error.details.get("writeErrors", [])
+        if any(write["code"] != DUPLICATE_KEY for write in errors):
+            raise
+        return [write["op"] for write in errors]
+    return []
+
+
+def notif_status_update(notif_type: Notif, status: bool = True) -> Mapping[str, Any]:
+    """Returns the update document setting the status of a notification.
+    Re-arming a notification starts a new incident, which is counted, so that
+    its next email is not taken for a duplicate of the previous one.
+
+    Args:
+        notif_type (Notif): The notification type to update.
+        status (bool, optional): Status of notification. Defaults to True.
+
+    Returns:
+        Mapping[str, Any]: MongoDB update document.
+    """
+    update: MutableMapping[str, Any] = {"$set": {f"{notif_type.name}.sent": status}}
+    if not status:
+        update["$inc"] = {f"{notif_type.name}.incident": 1}
+    return update
+
+
+class StatusWriter(Logger):
+    """Class for collecting notification status updates during a check and
+    writing them to MongoDB with `bulk_write`, one request per batch.
+
+    Attributes:
+        testing (bool): Use a test database for executing functions.
+        batch_size (Optional[int]): Number of updates per bulk write. Defaults
+            to the BULK_WRITE_BATCH_SIZE setting.
+        ordered (Optional[bool]): Stop a batch at the first failed update.
+            Defaults to the BULK_WRITE_ORDERED setting.
+    """
+
+    def __init__(
+        self,
+        testing: bool = False,
+        batch_size: Optional[int] = None,
+        ordered: Optional[bool] = None,
+    ) -> None:
+        """Initializes the StatusWriter class with an empty batch and a custom
+        logger."""
+        super().__init__(__name__)
+        self.__collection = get_collection(testing=testing)
+        self.__batch_size: int = batch_size or settings.BULK_WRITE_BATCH_SIZE
+        self.__ordered: bool = (
+            settings.BULK_WRITE_ORDERED if ordered is None else ordered
+        )
+        self.__operations: MutableSequence[UpdateOne] = []
+        self.__lock = threading.Lock()
+
+    def __enter__(self) -> "StatusWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.flush()
+
+    @property
+    def collection(self) -> Collection:
+        """Returns the MongoDB collection object."""
+        return self.__collection
+
+    def update_notif_status(
+        self, fingerprint: str, notif_type: Notif, status: bool = True
+    ) -> None:
+        """Queue an update of the status of a notification subscribed by the
+        relay operator. The batch is written once it is full. Re-arming a
+        notification starts a new incident, which is counted.
+
+        Args:
+            fingerprint (str): Fingerprint of the relay.
+            notif_type (Notif): The notification type to update.
+            status (bool, optional): Status of notification. Defaults to True.
+        """
+        operation = UpdateOne(
+            {"fingerprint": fingerprint, notif_type.name: {"$exists": True}},
+            notif_status_update(notif_type, status),
+        )
+        with self.__lock:
+            self.__operations.append(operation)
+            if len(self.__operations) < self.__batch_size:
+                return
+            operations, self.__operations = self.__operations, []
+        self.__write(operations)
+
+    def flush(self) -> None:
+        """Write all queued updates to the database."""
+        with self.__lock:
+            operations, self.__operations = self.__operations, []
+        if operations:
+            self.__write(operations)
+
+    def __write(self, operations: Sequence[UpdateOne]) -> None:
+        """Write a batch of updates with a single bulk write."""
+        try:
+            result = self.collection.bulk_write(operations, ordered=self.__ordered)
+        except BulkWriteError as error:
+            self.logger.error(
+                f"Bulk write of {len(operations)} notification status updates "
+                f"failed: {error.details.get('writeErrors')}"
+            )
+            return
+        self.logger.info(
+            f"Updated {result.modified_count} of {len(operations)} notification statuses."
+        )
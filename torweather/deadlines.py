@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Module for keeping the times at which notifications of relays become due,
+so that checks run when a deadline passes instead of at a fixed interval."""
+import heapq
+import threading
+from collections.abc import MutableMapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from typing import Optional
+from typing import Tuple
+
+
+class Deadlines:
+    """Priority queue of deadlines (seconds since epoch) of relays, ordered by
+    time. A relay has at most one deadline, scheduling it again replaces the
+    previous one. Replaced deadlines stay in the heap until they reach its top
+    or the heap is compacted, which keeps scheduling O(log n).
+    """
+
+    def __init__(self) -> None:
+        self.__heap: list[Tuple[float, str]] = []
+        self.__deadlines: MutableMapping[str, float] = {}
+        self.__lock = threading.Lock()
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self.__deadlines
+
+    def __len__(self) -> int:
+        return len(self.__deadlines)
+
+    def schedule(self, fingerprint: str, deadline: float) -> None:
+        """Set the deadline of a relay, replacing its previous deadline.
+
+        Args:
+            fingerprint (str): Fingerprint of the relay.
+            deadline (float): Time at which the notification becomes due.
+        """
+        with self.__lock:
+            self.__deadlines[fingerprint] = deadline
+            heapq.heappush(self.__heap, (deadline, fingerprint))
+            if len(self.__heap) > 2 * len(self.__deadlines) + 64:
+                self.__heap = [
+                    (deadline, fingerprint)
+                    for fingerprint, deadline in self.__deadlines.items()
+                ]
+                heapq.heapify(self.__heap)
+
+    def cancel(self, fingerprint: str) -> None:
+        """Remove the deadline of a relay, if any."""
+        with self.__lock:
+            self.__deadlines.pop(fingerprint, None)
+
+    def clear(self) -> None:
+        """Remove every deadline."""
+        with self.__lock:
+            self.__heap = []
+            self.__deadlines = {}
+
+    def __discard_replaced(self) -> None:
+        """Pop replaced and cancelled deadlines from the top of the heap."""
+        while self.__heap:
+            deadline, fingerprint = self.__heap[0]
+            if self.__deadlines.get(fingerprint) == deadline:
+                return
+            heapq.heappop(self.__heap)
+
+    def next(self) -> Optional[float]:
+        """Returns the earliest deadline, None if there is no deadline."""
+        with self.__lock:
+            self.__discard_replaced()
+            return self.__heap[0][0] if self.__heap else None
+
+    def pop_due(self, now: float) -> Sequence[str]:
+        """Remove and return the relays whose deadline has passed.
+
+        Args:
+            now (float): Current time in seconds since epoch.
+
+        Returns:
+            Sequence[str]: Fingerprints of the relays, earliest deadline first.
+        """
+        due: MutableSequence[str] = []
+        with self.__lock:
+            self.__discard_replaced()
+            while self.__heap and self.__heap[0][0] <= now:
+                _, fingerprint = heapq.heappop(self.__heap)
+                del self.__deadlines[fingerprint]
+                due.append(fingerprint)
+                self.__discard_replaced()
+        return due
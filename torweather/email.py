@@ -4,15 +4,62 @@ import smtplib
 import ssl
 from collections.abc import Sequence
 from email.mime.text import MIMEText
+from typing import Optional
+from typing import Tuple
 
 import dotenv
 
 from torweather.config import secrets
+from torweather.config import settings
 from torweather.exceptions import EmailSendError
 from torweather.logger import Logger
-from torweather.relay import Relay
+from torweather.mailer import Mailer
+from torweather.schemas import AnyRelayData
+from torweather.schemas import DIGEST
 from torweather.schemas import Notif
-from torweather.schemas import RelayData
+
+
+def mime_message(to: str, subject: str, message: str) -> MIMEText:
+    """Create a MIME message sent from the torweather address.
+
+    Args:
+        to (str): Email of the receiver.
+        subject (str): Subject of the email.
+        message (str): Content of the email.
+
+    Returns:
+        MIMEText: MIME message.
+    """
+    # Multipurpose Internet Mail Extension is an internet standard,
+    # encoded file format used by email programs.
+    mime = MIMEText(message)
+    mime["to"] = to
+    mime["from"] = f"Tor Weather <{secrets.EMAIL}>"
+    mime["subject"] = subject
+    return mime
+
+
+def digest_message(to: str, emails: Sequence[Tuple[str, str]]) -> MIMEText:
+    """Create a MIME message combining several emails to the same receiver,
+    one section per email.
+
+    Args:
+        to (str): Email of the receiver.
+        emails (Sequence[Tuple[str, str]]): Subject and content of every email.
+
+    Returns:
+        MIMEText: MIME message.
+    """
+    titles = [subject.removeprefix("[Tor Weather] ") for subject, _ in emails]
+    sections = "\n\n".join(
+        f"{title}\n{'-' * len(title)}\n{message}"
+        for title, (_, message) in zip(titles, emails)
+    )
+    return mime_message(
+        to,
+        DIGEST["subject"].format(len(emails)),
+        DIGEST["message"].format(len(emails), sections),
+    )
 
 
 class Email(Logger):
@@ -20,19 +67,35 @@ class Email(Logger):
     Transfer Protocol (SMTP) is used for sending emails.
 
     Attributes:
-        relay_data (RelayData): Data of the relay.
+        relay_data (AnyRelayData): Data of the relay.
         email (str): Email(s) of relay provider.
         notif_type (Message): Type of notification to be sent to the provider.
+        duration (Optional[int]): Duration before sending a notification (hours),
+            required for NODE_DOWN notifications.
+        incident (int): Number of times the notification was re-armed, which
+            tells apart the emails of successive incidents. Defaults to 0.
     """
 
-    def __init__(self, relay_data: RelayData, email: str, notif_type: Notif) -> None:
+    def __init__(
+        self,
+        relay_data: AnyRelayData,
+        email: str,
+        notif_type: Notif,
+        duration: Optional[int] = None,
+        incident: int = 0,
+    ) -> None:
         """Initializes the Email class and a logger instance."""
         super().__init__(__name__)
+        if notif_type == Notif.NODE_DOWN and duration is None:
+            raise ValueError("duration is required for NODE_DOWN notifications.")
         self.relay = relay_data
         self.email = email
         self.type = notif_type
+        self.duration = duration
+        self.incident = incident
         self.__subject = self.type.value["subject"]
-        self.__message = self.type.value["message"]
+        self.__template = self.type.value["message"]
+        self.__message: Optional[str] = None
 
     @property
     def subject(self) -> str:
@@ -41,29 +104,46 @@ class Email(Logger):
 
     @property
     def message(self) -> str:
-        """Returns the formatted content of message with relevant data of the Tor relay."""
+        """Returns the formatted content of message with relevant data of the Tor relay.
+        The message is rendered once, only from the data given to the Email object."""
+        if self.__message is None:
+            self.__message = self.__render()
+        return self.__message
+
+    def __render(self) -> str:
+        """Format the message template of the notification type."""
         if self.type == Notif.NODE_DOWN:
-            self.__message = self.__message.format(
+            return self.__template.format(
                 self.relay.nickname,
                 self.relay.fingerprint,
-                Relay(self.relay.fingerprint, testing=True).duration,
+                self.duration,
                 self.relay.last_seen,
             )
         elif self.type == Notif.OUTDATED_VER:
-            self.__message = self.__message.format(
+            return self.__template.format(
                 self.relay.nickname,
                 self.relay.fingerprint,
                 self.relay.version_status,
             )
-        return self.__message
+        return self.__template
+
+    @property
+    def mime(self) -> MIMEText:
+        """Returns the email as a MIME message."""
+        return mime_message(self.email, self.subject, self.message)
 
-    def send(self, server: str = "smtp.gmail.com") -> bool:
+    def send(
+        self, server: str = settings.SMTP_SERVER, mailer: Optional[Mailer] = None
+    ) -> bool:
         """Send an email to a Tor relay provider using SMTP. For
         the SMTP server, either localhost or APIs like Mailgun can
         be used.
 
         Args:
-            server (str, optional): Server domain string. Defaults to "smtp.gmail.com".
+            server (str, optional): Server domain string. Defaults to the
+                SMTP_SERVER setting.
+            mailer (Optional[Mailer], optional): Mailer whose pooled SMTP sessions
+                are used, instead of opening a connection for this email only.
 
         Raises:
             EmailSendError: Error occured while sending the email.
@@ -71,16 +151,19 @@ class Email(Logger):
         Returns:
             bool: True if email is sent succesfully.
         """
-        # Multipurpose Internet Mail Extension is an internet standard,
-        # encoded file format used by email programs.
-        message = MIMEText(self.message)
-        message["to"] = self.email
-        message["from"] = f"Tor Weather <{secrets.EMAIL}>"
-        message["subject"] = self.subject
+        message = self.mime
+        if mailer is not None:
+            mailer.send(message)
+            self.logger.info(f"Email sent to {self.email}.")
+            return True
         try:
             context = ssl.create_default_context()
-            # Port 465 is used for Secure Sockets Layer (SSL).
-            with smtplib.SMTP_SSL(server, 465, context=context) as smtp_server:
+            with smtplib.SMTP_SSL(
+                server,
+                settings.SMTP_PORT,
+                context=context,
+                timeout=settings.SMTP_TIMEOUT,
+            ) as smtp_server:
                 smtp_server.login(secrets.EMAIL, secrets.PASSWORD)
                 smtp_server.send_message(message)
             self.logger.info(f"Email sent to {self.email}.")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Module for creating the indexes of the subscribers collection and reporting
+their usage. Can be run as `python -m torweather.indexes`."""
+import argparse
+from collections.abc import Mapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from typing import Any
+
+from pymongo import ASCENDING
+from pymongo import IndexModel
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
+from pymongo.errors import PyMongoError
+
+from torweather.database import get_collection
+from torweather.logger import Logger
+from torweather.schemas import Notif
+
+
+class Indexes(Logger):
+    """Class for managing the indexes of the subscribers collection.
+
+    Attributes:
+        testing (bool): Use a test database for executing functions.
+    """
+
+    def __init__(self, testing: bool = False) -> None:
+        """Initializes the Indexes class with the subscribers collection and a
+        custom logger."""
+        super().__init__(__name__)
+        self.__collection = get_collection(testing=testing)
+
+    @property
+    def collection(self) -> Collection:
+        """Returns the MongoDB collection object."""
+        return self.__collection
+
+    @property
+    def models(self) -> Sequence[IndexModel]:
+        """Returns the indexes of the subscribers collection.
+
+        Every relay is looked up by its fingerprint, so it gets a unique index.
+        Checks only scan documents with a notification not sent yet, so every
+        notification type gets a partial index on `<NOTIF>.sent: false`, which
+        stays as small as the number of pending notifications.
+        """
+        models: MutableSequence[IndexModel] = [
+            IndexModel([("fingerprint", ASCENDING)], name="fingerprint", unique=True)
+        ]
+        for notif in Notif:
+            models.append(
+                IndexModel(
+                    [(f"{notif.name}.sent", ASCENDING)],
+                    name=f"{notif.name}_pending",
+                    partialFilterExpression={f"{notif.name}.sent": False},
+                )
+            )
+        return models
+
+    def ensure(self) -> Sequence[str]:
+        """Create the indexes of the subscribers collection. Existing indexes
+        are left untouched. Connection errors are logged, so that an
+        unreachable database does not stop the server from starting.
+
+        Raises:
+            OperationFailure: The database refused an index, e.g. the unique
+                `fingerprint` index as the collection holds duplicate relays.
+                Subscriptions rely on it to reject duplicates.
+
+        Returns:
+            Sequence[str]: Names of the indexes, empty if they were not created.
+        """
+        try:
+            names: Sequence[str] = self.collection.create_indexes(list(self.models))
+        except OperationFailure as error:
+            self.logger.error(f"Unable to create indexes: {error}")
+            raise
+        except PyMongoError as error:
+            self.logger.error(f"Unable to create indexes: {error}")
+            return []
+        self.logger.info(f"Ensured indexes {', '.join(names)}.")
+        return names
+
+    def usage(self) -> Sequence[Mapping[str, Any]]:
+        """Returns the usage of every index of the subscribers collection
+        since the MongoDB server started.
+
+        Returns:
+            Sequence[Mapping[str, Any]]: Name, number of operations and start
+                time of counting of every index.
+        """
+        return [
+            {
+                "name": stats["name"],
+                "ops": stats["accesses"]["ops"],
+                "since": stats["accesses"]["since"],
+            }
+            for stats in self.collection.aggregate([{"$indexStats": {}}])
+        ]
+
+
+def main() -> None:
+    """Create the indexes of the subscribers collection and print their usage."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--testing", action="store_true", help="use the test database")
+    parser.add_argument(
+        "--report", action="store_true", help="only print the usage of indexes"
+    )
+    args = parser.parse_args()
+    indexes = Indexes(testing=args.testing)
+    if not args.report:
+        indexes.ensure()
+    for stats in indexes.usage():
+        print(f"{stats['name']}: {stats['ops']} operations since {stats['since']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""Module for electing a single leader among torweather processes with a lease
+stored in MongoDB."""
+import os
+import socket
+import uuid
+from datetime import datetime
+from datetime import timedelta
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+from torweather.config import settings
+from torweather.database import get_collection
+from torweather.logger import Logger
+
+
+class Lease(Logger):
+    """Class for holding a named lease, a document of the `leases` collection
+    with the identity of its owner and an expiry time. A process holds the
+    lease until it expires, so it has to renew it regularly. If the owner
+    dies, the lease expires and is taken by another process.
+
+    Expiry times are set with the clock of each process, so the TTL must be
+    much longer than the clock skew between hosts.
+
+    Attributes:
+        name (str): Name of the lease.
+        ttl (int): Seconds for which an acquired lease is held.
+        testing (bool): Use a test database for executing functions.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: int = settings.LEASE_TTL,
+        testing: bool = False,
+    ) -> None:
+        """Initializes the Lease class with a unique owner identity and a
+        custom logger."""
+        super().__init__(__name__)
+        self.name = name
+        self.ttl = ttl
+        self.__owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.__collection = get_collection("leases", testing=testing)
+
+    @property
+    def owner(self) -> str:
+        """Returns the identity of this process."""
+        return self.__owner
+
+    @property
+    def collection(self) -> Collection:
+        """Returns the MongoDB collection object."""
+        return self.__collection
+
+    def acquire(self) -> bool:
+        """Acquire the lease if it is free or expired, or renew it if it is
+        already held by this process.
+
+        Returns:
+            bool: True if this process holds the lease.
+        """
+        now = datetime.utcnow()
+        try:
+            document = self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"owner": self.owner}, {"expires": {"$lt": now}}],
+                },
+                {
+                    "$set": {
+                        "owner": self.owner,
+                        "expires": now + timedelta(seconds=self.ttl),
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lease exists and is held by another process, so the upsert
+            # tried to insert a second document with the same name.
+            return False
+        return document is not None and document["owner"] == self.owner
+
+    def release(self) -> None:
+        """Release the lease if it is held by this process, so that another
+        process can acquire it without waiting for it to expire."""
+        self.collection.delete_one({"_id": self.name, "owner": self.owner})
@@ -33,7 +33,10 @@ class Logger:
         return self.__logger
 
     def __set_logging_handler(self) -> None:
-        """Creates and sets a file handler for the custom logger."""
+        """Creates and sets a file handler for the custom logger. Loggers are
+        shared by name, so the handler is only added once per module."""
+        if self.logger.handlers:
+            return
         if not os.path.isdir(os.path.join(self.directory, "logs")):
             os.mkdir(os.path.join(self.directory, "logs"))
         handler = logging.FileHandler(
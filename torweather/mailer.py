@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""Module for sending many emails over a pool of persistent SMTP sessions."""
+import queue
+import smtplib
+import ssl
+import threading
+from email.message import Message
+
+from torweather.config import secrets
+from torweather.config import settings
+from torweather.exceptions import EmailSendError
+from torweather.logger import Logger
+
+
+class Session:
+    """An authenticated SMTP connection and the number of messages sent
+    over it."""
+
+    def __init__(self, connection: smtplib.SMTP_SSL) -> None:
+        self.connection = connection
+        self.sent = 0
+
+
+class Mailer(Logger):
+    """Class for sending emails over a pool of SMTP sessions which are opened
+    and authenticated once, instead of once per email. Sessions are reopened
+    when the server drops them and rotated after a number of messages, as
+    providers limit the messages sent over a single connection.
+
+    Attributes:
+        server (str): Server domain string.
+        port (int): Port of the SSL SMTP server.
+        pool_size (int): Maximum number of simultaneous sessions.
+        max_messages (int): Messages sent over a session before reopening it.
+    """
+
+    def __init__(
+        self,
+        server: str = settings.SMTP_SERVER,
+        port: int = settings.SMTP_PORT,
+        pool_size: int = settings.SMTP_POOL_SIZE,
+        max_messages: int = settings.SMTP_MAX_MESSAGES_PER_SESSION,
+    ) -> None:
+        """Initializes the Mailer class with an empty session pool and a custom
+        logger. Sessions are opened on first use."""
+        super().__init__(__name__)
+        self.server = server
+        self.port = port
+        self.pool_size = pool_size
+        self.max_messages = max_messages
+        self.__context = ssl.create_default_context()
+        self.__idle: queue.LifoQueue[Session] = queue.LifoQueue()
+        self.__opened = 0
+        self.__lock = threading.Lock()
+
+    def __enter__(self) -> "Mailer":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __connect(self) -> Session:
+        """Open and authenticate a new SMTP session."""
+        # Port 465 is used for Secure Sockets Layer (SSL).
+        connection = smtplib.SMTP_SSL(
+            self.server,
+            self.port,
+            context=self.__context,
+            timeout=settings.SMTP_TIMEOUT,
+        )
+        try:
+            connection.login(secrets.EMAIL, secrets.PASSWORD)
+        except:
+            connection.close()
+            raise
+        return Session(connection)
+
+    def __acquire(self) -> Session:
+        """Returns an idle session, opening a new one if the pool is not full,
+        else waits for a session to be released."""
+        while True:
+            try:
+                return self.__idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.__lock:
+                if self.__opened < self.pool_size:
+                    self.__opened += 1
+                    break
+            # Wake up regularly, as a discarded session frees a slot in the
+            # pool without being put back in the queue.
+            try:
+                return self.__idle.get(timeout=1)
+            except queue.Empty:
+                continue
+        try:
+            return self.__connect()
+        except:
+            with self.__lock:
+                self.__opened -= 1
+            raise
+
+    def __release(self, session: Session) -> None:
+        """Return a session to the pool, closing it once it has sent the
+        maximum number of messages."""
+        if session.sent >= self.max_messages:
+            self.__discard(session)
+        else:
+            self.__idle.put(session)
+
+    def __discard(self, session: Session) -> None:
+        """Close a session and free its slot in the pool."""
+        try:
+            session.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            session.connection.close()
+        with self.__lock:
+            self.__opened -= 1
+
+    def send(self, message: Message) -> None:
+        """Send a message over a pooled session. If the session was dropped by
+        the server, the message is retried once over a new session.
+
+        Args:
+            message (Message): Message with "to", "from" and "subject" headers.
+
+        Raises:
+            EmailSendError: Error occured while sending the email.
+        """
+        for _ in range(2):
+            try:
+                session = self.__acquire()
+            except (smtplib.SMTPException, OSError):
+                self.logger.error(f"Unable to connect to {self.server}.")
+                raise EmailSendError(message["to"])
+            try:
+                session.connection.send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # The connection is broken, so it cannot be reused.
+                self.__discard(session)
+                continue
+            except smtplib.SMTPException:
+                # The server refused this message, the session is still usable.
+                self.__release(session)
+                break
+            except OSError:
+                self.__discard(session)
+                continue
+            session.sent += 1
+            self.__release(session)
+            return
+        self.logger.error(f"Unable to send email to {message['to']}.")
+        raise EmailSendError(message["to"])
+
+    def close(self) -> None:
+        """Close all idle sessions."""
+        while True:
+            try:
+                session = self.__idle.get_nowait()
+            except queue.Empty:
+                break
+            self.__discard(session)
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+"""Module for querying the onionoo API with conditional requests, caching the
+responses on disk so that unchanged documents are not downloaded again."""
+import codecs
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from collections.abc import Iterator
+from collections.abc import Mapping
+from typing import Any
+from typing import Optional
+from typing import Tuple
+
+import requests  # type: ignore
+from requests.structures import CaseInsensitiveDict  # type: ignore
+
+from torweather.config import settings
+from torweather.logger import Logger
+
+
+class Onionoo(Logger):
+    """Class for fetching onionoo documents. Every response body is stored on
+    disk with its `Last-Modified` header, which is sent back as
+    `If-Modified-Since` on the next request. If onionoo answers with
+    304 Not Modified, the cached body is reused.
+
+    Attributes:
+        url (str): Base URL of the onionoo service.
+        cache_directory (str): Directory for storing cached responses.
+    """
+
+    def __init__(
+        self, url: str = settings.ONIONOO_URL, cache_directory: Optional[str] = None
+    ) -> None:
+        """Initializes the Onionoo class with a HTTP session and a custom logger."""
+        super().__init__(__name__)
+        self.__url = url.rstrip("/")
+        cache_directory = cache_directory or settings.ONIONOO_CACHE_DIR
+        self.__cache_directory = os.path.join(self.directory, cache_directory)
+        self.__session = requests.Session()
+        self.__session.headers = CaseInsensitiveDict(  # type: ignore
+            {
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko)Chrome/94.0.4606.81 Safari/537.36"
+            }
+        )
+        # Parsed payloads of recently used responses, to avoid reading and
+        # decoding the same file from disk on every 304 response.
+        self.__memory: OrderedDict[str, Tuple[str, Mapping[str, Any]]] = OrderedDict()
+        self.__memory_size = 1024
+        self.__chunk_size = 64 * 1024
+        self.__lock = threading.Lock()
+        # The disk cache is pruned once every `__prune_interval` stores.
+        self.__stores = 0
+        self.__prune_interval = 100
+
+    @property
+    def url(self) -> str:
+        """Returns the onionoo service URL."""
+        return self.__url
+
+    @property
+    def cache_directory(self) -> str:
+        """Returns the path of the cache directory."""
+        return self.__cache_directory
+
+    def __query(self, document: str, params: Mapping[str, str]) -> str:
+        """Returns the URL of an onionoo document with the query parameters
+        sorted, so that equal queries share a cache entry."""
+        query = "&".join(f"{key}={value}" for key, value in sorted(params.items()))
+        return f"{self.url}/{document}?{query}" if query else f"{self.url}/{document}"
+
+    def __paths(self, url: str) -> Tuple[str, str]:
+        """Returns the paths of the cached body and metadata of a URL."""
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return (
+            os.path.join(self.cache_directory, f"{key}.json"),
+            os.path.join(self.cache_directory, f"{key}.meta"),
+        )
+
+    def __write(self, path: str, content: bytes) -> None:
+        """Atomically write a file, so that a crash never leaves a partially
+        written cache entry behind."""
+        os.makedirs(self.cache_directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=self.cache_directory)
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+    def __load(self, url: str) -> Optional[Tuple[str, Mapping[str, Any]]]:
+        """Returns the last modified time and payload of a cached URL."""
+        if url in self.__memory:
+            self.__memory.move_to_end(url)
+            return self.__memory[url]
+        body_path, meta_path = self.__paths(url)
+        try:
+            with open(meta_path) as file:
+                meta: Mapping[str, str] = json.load(file)
+            with open(body_path, "rb") as file:
+                payload: Mapping[str, Any] = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        self.__remember(url, meta["last_modified"], payload)
+        return self.__memory[url]
+
+    def __remember(
+        self, url: str, last_modified: str, payload: Mapping[str, Any]
+    ) -> None:
+        """Keep a parsed payload in memory, evicting the least recently used."""
+        self.__memory[url] = (last_modified, payload)
+        self.__memory.move_to_end(url)
+        while len(self.__memory) > self.__memory_size:
+            self.__memory.popitem(last=False)
+
+    def __store(self, url: str, last_modified: str, body: bytes) -> None:
+        """Save the body and last modified time of a response to the cache."""
+        body_path, meta_path = self.__paths(url)
+        try:
+            self.__write(body_path, body)
+            self.__write(
+                meta_path,
+                json.dumps({"url": url, "last_modified": last_modified}).encode(),
+            )
+        except OSError:
+            self.logger.warning(f"Unable to cache response of {url}.")
+        self.__stores += 1
+        if self.__stores % self.__prune_interval == 0:
+            self.prune()
+
+    def prune(self) -> int:
+        """Remove the cache entries written more than ONIONOO_CACHE_MAX_AGE
+        seconds ago, then the oldest entries beyond ONIONOO_CACHE_MAX_ENTRIES,
+        so that the cache does not grow with every distinct query.
+
+        Returns:
+            int: Number of entries removed.
+        """
+
+        def written(path: str) -> float:
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0.0
+
+        try:
+            metas = [
+                entry.path
+                for entry in os.scandir(self.cache_directory)
+                if entry.name.endswith(".meta")
+            ]
+        except OSError:
+            return 0
+        metas.sort(key=written, reverse=True)
+        now = time.time()
+        removed = 0
+        for index, meta_path in enumerate(metas):
+            if (
+                index < settings.ONIONOO_CACHE_MAX_ENTRIES
+                and now - written(meta_path) <= settings.ONIONOO_CACHE_MAX_AGE
+            ):
+                continue
+            for path in (meta_path, f"{meta_path[: -len('.meta')]}.json"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            removed += 1
+        if removed:
+            self.logger.info(f"{removed} onionoo responses removed from the cache.")
+        return removed
+
+    def get(self, document: str, **params: str) -> Mapping[str, Any]:
+        """Fetch an onionoo document, reusing the cached response if the
+        document has not been modified since it was cached.
+
+        Args:
+            document (str): Name of the document, e.g. "details" or "summary".
+            **params (str): Query parameters of the request.
+
+        Raises:
+            requests.HTTPError: Onionoo responded with an error status.
+
+        Returns:
+            Mapping[str, Any]: Decoded JSON document.
+        """
+        url = self.__query(document, params)
+        with self.__lock:
+            cached = self.__load(url)
+        headers = {"If-Modified-Since": cached[0]} if cached else {}
+        response = self.__session.get(url, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1]
+        response.raise_for_status()
+        payload: Mapping[str, Any] = response.json()
+        last_modified: Optional[str] = response.headers.get("Last-Modified")
+        if last_modified:
+            with self.__lock:
+                self.__remember(url, last_modified, payload)
+                # Empty results, e.g. of a mistyped fingerprint, are only kept
+                # in memory, so that queries of user input cannot fill the disk.
+                if any(payload.get(key) for key in ("relays", "bridges")):
+                    self.__store(url, last_modified, response.content)
+        return payload
+
+    def published(self) -> Optional[str]:
+        """Returns the time at which onionoo last published relay data. An
+        empty summary document is requested, which onionoo answers with 304
+        Not Modified until new data is published.
+
+        Raises:
+            requests.HTTPError: Onionoo responded with an error status.
+
+        Returns:
+            Optional[str]: Publication time, e.g. "2022-03-20 10:00:00".
+        """
+        published: Optional[str] = self.get("summary", limit="0").get(
+            "relays_published"
+        )
+        return published
+
+    def __last_modified(self, url: str) -> Optional[str]:
+        """Returns the last modified time of a cached URL whose body is on
+        disk, without loading the body."""
+        body_path, meta_path = self.__paths(url)
+        try:
+            with open(meta_path) as file:
+                meta: Mapping[str, str] = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not os.path.isfile(body_path):
+            return None
+        return meta["last_modified"]
+
+    def stream(self, document: str, key: str, **params: str) -> Iterator[Any]:
+        """Fetch an onionoo document and yield the items of one of its arrays
+        one at a time, so that the whole document is never held in memory.
+        The response is written to the cache while it is parsed, and read
+        back from the cache if onionoo answers with 304 Not Modified.
+
+        Args:
+            document (str): Name of the document, e.g. "details" or "summary".
+            key (str): Name of the array to yield the items of, e.g. "relays".
+            **params (str): Query parameters of the request.
+
+        Raises:
+            requests.HTTPError: Onionoo responded with an error status.
+
+        Yields:
+            Any: Decoded items of the array.
+        """
+        url = self.__query(document, params)
+        body_path, meta_path = self.__paths(url)
+        last_modified = self.__last_modified(url)
+        headers = {"If-Modified-Since": last_modified} if last_modified else {}
+        with self.__session.get(url, headers=headers, stream=True) as response:
+            if response.status_code == 304 and last_modified:
+                with open(body_path, "rb") as cached:
+                    yield from iter_json_array(
+                        iter(lambda: cached.read(self.__chunk_size), b""), key
+                    )
+                return
+            response.raise_for_status()
+            last_modified = response.headers.get("Last-Modified")
+            if not last_modified:
+                yield from iter_json_array(
+                    response.iter_content(self.__chunk_size), key
+                )
+                return
+            os.makedirs(self.cache_directory, exist_ok=True)
+            descriptor, temp_path = tempfile.mkstemp(dir=self.cache_directory)
+            try:
+                with os.fdopen(descriptor, "wb") as temp:
+
+                    def chunks() -> Iterator[bytes]:
+                        for chunk in response.iter_content(self.__chunk_size):
+                            temp.write(chunk)
+                            yield chunk
+
+                    yield from iter_json_array(chunks(), key)
+                    # Store the rest of the document after the array.
+                    for chunk in response.iter_content(self.__chunk_size):
+                        temp.write(chunk)
+                os.replace(temp_path, body_path)
+                self.__write(
+                    meta_path,
+                    json.dumps({"url": url, "last_modified": last_modified}).encode(),
+                )
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+
+def iter_json_array(chunks: Iterable[bytes], key: str) -> Iterator[Any]:
+    """Incrementally decode the items of an array in a JSON object.
+
+    Only the item being decoded and the chunk it is in are kept in memory.
+    The array is found by its key, which must not appear as a string value
+    before it.
+
+    Args:
+        chunks (Iterable[bytes]): UTF-8 encoded JSON document, in chunks.
+        key (str): Key of the array to decode.
+
+    Raises:
+        ValueError: The document ended before the array was complete.
+
+    Yields:
+        Any: Decoded items of the array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+    separator = re.compile(r"[\s,]*")
+    iterator = iter(chunks)
+    buffer = ""
+    position = 0
+    found = False
+    exhausted = False
+    while True:
+        if not found:
+            match = start.search(buffer)
+            if match:
+                found = True
+                position = match.end()
+                continue
+            # Keep the end of the buffer, the key might be split in two chunks.
+            buffer = buffer[-len(key) - 16 :]
+        else:
+            position = separator.match(buffer, position).end()  # type: ignore
+            if position < len(buffer):
+                if buffer[position] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # The item is not complete yet, read another chunk.
+                    pass
+                else:
+                    # A number at the end of the buffer, or before a "." or
+                    # an exponent, might continue in the next chunk, e.g.
+                    # "12" followed by "34", or "3." followed by "5".
+                    if exhausted or (end < len(buffer) and buffer[end] not in ".eE"):
+                        position = end
+                        yield item
+                        continue
+            # Drop the decoded part of the buffer before reading more.
+            buffer = buffer[position:]
+            position = 0
+        if exhausted:
+            raise ValueError(
+                f'JSON document ended before the end of the "{key}" array.'
+            )
+        chunk = next(iterator, None)
+        if chunk is None:
+            exhausted = True
+            buffer += utf8.decode(b"", final=True)
+        else:
+            buffer += utf8.decode(chunk)
+
+
+onionoo = Onionoo()
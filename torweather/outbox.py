@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+"""Module for queueing rendered emails in a MongoDB outbox during checks and
+delivering them with a pool of worker threads, independently of the checks."""
+import hashlib
+import threading
+import uuid
+from collections.abc import Iterable
+from collections.abc import Mapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+from typing import Optional
+from typing import Tuple
+
+from pymongo import ASCENDING
+from pymongo import IndexModel
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from torweather.config import settings
+from torweather.database import get_collection
+from torweather.database import insert_ignoring_duplicates
+from torweather.email import digest_message
+from torweather.email import Email
+from torweather.email import mime_message
+from torweather.exceptions import EmailSendError
+from torweather.logger import Logger
+from torweather.mailer import Mailer
+from torweather.ratelimit import RateLimiter
+
+# Order in which due emails are sent, the lowest priority first. Emails of
+# other notification types are sent last.
+PRIORITIES: Mapping[str, int] = {"NODE_DOWN": 0, "OUTDATED_VER": 1}
+
+
+class Outbox(Logger):
+    """Class for storing emails to send in the `outbox` collection.
+
+    Every email is stored once, with an idempotency key derived from its
+    recipient and content as `_id`. Queueing the same email again, e.g. when
+    a check is retried, does nothing. Due emails are claimed by priority of
+    their notification type, then by time, along with the other pending
+    emails to the same address, which are sent together as a digest. An
+    email is in one of the states:
+
+    - "pending": waiting for its next attempt.
+    - "sending": claimed by a delivery thread until `locked_until`, after
+      which it can be claimed again, in case the thread died.
+    - "sent": delivered, removed after OUTBOX_RETENTION seconds.
+    - "dead": failed `max_attempts` times, kept for inspection.
+
+    Attributes:
+        testing (bool): Use a test database for executing functions.
+        max_attempts (int): Attempts before an email is dead-lettered.
+    """
+
+    def __init__(
+        self, testing: bool = False, max_attempts: int = settings.OUTBOX_MAX_ATTEMPTS
+    ) -> None:
+        """Initializes the Outbox class with the outbox collection and a custom
+        logger."""
+        super().__init__(__name__)
+        self.max_attempts = max_attempts
+        self.__collection = get_collection("outbox", testing=testing)
+
+    @property
+    def collection(self) -> Collection:
+        """Returns the MongoDB collection object."""
+        return self.__collection
+
+    def ensure(self) -> None:
+        """Create the index used for claiming emails, and the TTL index
+        removing sent emails after OUTBOX_RETENTION seconds. Errors are
+        logged."""
+        try:
+            self.collection.create_indexes(
+                [
+                    IndexModel(
+                        [
+                            ("status", ASCENDING),
+                            ("priority", ASCENDING),
+                            ("next_attempt", ASCENDING),
+                        ],
+                        name="status_priority_next_attempt",
+                    ),
+                    IndexModel(
+                        [("sent", ASCENDING)],
+                        name="sent_ttl",
+                        expireAfterSeconds=settings.OUTBOX_RETENTION,
+                    ),
+                ]
+            )
+        except PyMongoError as error:
+            self.logger.error(f"Unable to create outbox indexes: {error}")
+
+    @staticmethod
+    def key(email: Email) -> str:
+        """Returns the idempotency key of an email. The emails of successive
+        incidents of a notification get different keys, even if their content
+        is the same, e.g. a relay running an outdated version again."""
+        content = "\n".join(
+            [email.email, email.subject, email.message, str(email.incident)]
+        )
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def enqueue(self, emails: Iterable[Email]) -> int:
+        """Store emails to be sent by the delivery threads.
+
+        Args:
+            emails (Iterable[Email]): Emails to send.
+
+        Raises:
+            BulkWriteError: An email could not be stored, for another reason
+                than being stored already.
+
+        Returns:
+            int: Number of emails stored, excluding those already stored.
+        """
+        now = datetime.utcnow()
+        # Emails are held for the digest window, so that emails to the same
+        # address queued in the meantime are sent with them.
+        next_attempt = now + timedelta(seconds=settings.DIGEST_WINDOW)
+        documents = [
+            {
+                "_id": self.key(email),
+                "fingerprint": email.relay.fingerprint,
+                "notif": email.type.name,
+                "to": email.email,
+                "subject": email.subject,
+                "message": email.message,
+                "status": "pending",
+                "priority": PRIORITIES.get(email.type.name, len(PRIORITIES)),
+                "attempts": 0,
+                "next_attempt": next_attempt,
+                "created": now,
+            }
+            for email in emails
+        ]
+        duplicates = insert_ignoring_duplicates(self.collection, documents)
+        return len(documents) - len(duplicates)
+
+    def claim(self) -> Optional[Mapping[str, Any]]:
+        """Claim the due email with the highest priority and the earliest
+        attempt, or an email whose claim expired.
+
+        Returns:
+            Optional[Mapping[str, Any]]: Claimed email, None if none is due.
+        """
+        now = datetime.utcnow()
+        document: Optional[Mapping[str, Any]] = self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "next_attempt": {"$lte": now}},
+                    {"status": "sending", "locked_until": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {
+                    "status": "sending",
+                    "locked_until": now
+                    + timedelta(seconds=settings.OUTBOX_LOCK_TIMEOUT),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", ASCENDING), ("next_attempt", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return document
+
+    def claim_digest(self, document: Mapping[str, Any]) -> Sequence[Mapping[str, Any]]:
+        """Claim the other pending emails to the address of a claimed email, to
+        send them in a single digest. New emails are claimed whether they are
+        due or not, failed emails only once their backoff is nearly over, so
+        that they are not retried early.
+
+        Args:
+            document (Mapping[str, Any]): Claimed email.
+
+        Returns:
+            Sequence[Mapping[str, Any]]: The claimed email followed by the other
+                emails, by priority and time.
+        """
+        now = datetime.utcnow()
+        # Emails claimed by this call are marked with a unique token, as
+        # another thread might claim some of them at the same time.
+        token = uuid.uuid4().hex
+        self.collection.update_many(
+            {
+                "to": document["to"],
+                "status": "pending",
+                "$or": [
+                    {"attempts": 0},
+                    {
+                        "next_attempt": {
+                            "$lte": now + timedelta(seconds=settings.DIGEST_WINDOW)
+                        }
+                    },
+                ],
+            },
+            {
+                "$set": {
+                    "status": "sending",
+                    "locked_until": now
+                    + timedelta(seconds=settings.OUTBOX_LOCK_TIMEOUT),
+                    "claim": token,
+                },
+                "$inc": {"attempts": 1},
+            },
+        )
+        others = self.collection.find({"claim": token, "status": "sending"}).sort(
+            [("priority", ASCENDING), ("next_attempt", ASCENDING)]
+        )
+        return [document, *others]
+
+    def complete(self, documents: Sequence[Mapping[str, Any]]) -> None:
+        """Mark claimed emails as sent."""
+        self.collection.update_many(
+            {"_id": {"$in": [document["_id"] for document in documents]}},
+            {"$set": {"status": "sent", "sent": datetime.utcnow()}},
+        )
+
+    def sent(self, period: float) -> Sequence[Tuple[str, float]]:
+        """Returns the emails sent over the last `period` seconds, the emails
+        of a digest being sent as one.
+
+        Args:
+            period (float): Seconds to look back, at most OUTBOX_RETENTION.
+
+        Returns:
+            Sequence[Tuple[str, float]]: Recipient and age (seconds) of every
+                email sent.
+        """
+        now = datetime.utcnow()
+        # The emails of a digest are completed at once, with the same time.
+        pipeline: Sequence[Mapping[str, Any]] = [
+            {
+                "$match": {
+                    "status": "sent",
+                    "sent": {"$gte": now - timedelta(seconds=period)},
+                }
+            },
+            {"$group": {"_id": {"to": "$to", "sent": "$sent"}}},
+        ]
+        return [
+            (group["_id"]["to"], (now - group["_id"]["sent"]).total_seconds())
+            for group in self.collection.aggregate(pipeline)
+        ]
+
+    def postpone(self, documents: Sequence[Mapping[str, Any]], delay: float) -> None:
+        """Release claimed emails which were not sent because of a rate limit,
+        until the next window. It does not count as an attempt."""
+        self.collection.update_many(
+            {"_id": {"$in": [document["_id"] for document in documents]}},
+            {
+                "$set": {
+                    "status": "pending",
+                    "next_attempt": datetime.utcnow() + timedelta(seconds=delay),
+                },
+                "$inc": {"attempts": -1},
+            },
+        )
+
+    def retry(self, document: Mapping[str, Any], error: str) -> None:
+        """Schedule the next attempt of a claimed email with an exponential
+        backoff, or dead-letter it after the maximum number of attempts."""
+        attempts: int = document["attempts"]
+        if attempts >= self.max_attempts:
+            self.collection.update_one(
+                {"_id": document["_id"]}, {"$set": {"status": "dead", "error": error}}
+            )
+            self.logger.error(
+                f"Email {document['_id']} to {document['to']} dead-lettered after "
+                f"{attempts} attempts: {error}"
+            )
+            return
+        backoff = min(
+            settings.OUTBOX_BACKOFF * 2 ** (attempts - 1), settings.OUTBOX_MAX_BACKOFF
+        )
+        self.collection.update_one(
+            {"_id": document["_id"]},
+            {
+                "$set": {
+                    "status": "pending",
+                    "next_attempt": datetime.utcnow() + timedelta(seconds=backoff),
+                    "error": error,
+                }
+            },
+        )
+
+
+class Deliverer(Logger):
+    """Class for delivering the emails of the outbox with a pool of threads
+    sending over a mailer, within the rate limits of the mail server. Emails
+    are claimed atomically, so a crashed process never loses an email, but
+    rate limits and digests only hold if a single process delivers at a time.
+
+    Attributes:
+        outbox (Outbox): Outbox to deliver the emails of.
+        mailer (Mailer): Mailer used for sending emails.
+        limiter (Optional[RateLimiter]): Rate limits of the mail server.
+            Defaults to the limits of the MAIL_RATE_LIMITS and
+            MAIL_DOMAIN_RATE_LIMITS settings.
+        workers (int): Number of threads sending emails.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        mailer: Mailer,
+        limiter: Optional[RateLimiter] = None,
+        workers: int = settings.OUTBOX_WORKERS,
+    ) -> None:
+        """Initializes the Deliverer class with a custom logger. Threads are
+        started when entering the context."""
+        super().__init__(__name__)
+        self.outbox = outbox
+        self.mailer = mailer
+        self.limiter = limiter or RateLimiter()
+        self.workers = workers
+        self.__threads: MutableSequence[threading.Thread] = []
+        self.__stopped = threading.Event()
+        # Held while claiming an email and the others to its address, so that
+        # no other thread claims a part of the digest.
+        self.__claiming = threading.Lock()
+
+    def __enter__(self) -> "Deliverer":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start the delivery threads. The rate limits are first refilled from
+        the emails sent recently, by this process or by the one which
+        delivered before it."""
+        try:
+            self.limiter.seed(self.outbox.sent(self.limiter.period))
+        except PyMongoError as error:
+            # Without the emails sent recently, the limits are only safe with
+            # empty buckets.
+            self.logger.error(f"Unable to get the emails sent recently: {error}")
+            self.limiter.drain()
+        self.__stopped.clear()
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self.__deliver, daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+
+    def stop(self) -> None:
+        """Stop the delivery threads once their current email is sent."""
+        self.__stopped.set()
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = []
+        self.mailer.close()
+
+    def deliver(self) -> bool:
+        """Claim and send one email of the outbox, as a digest with the other
+        pending emails to the same address.
+
+        Returns:
+            bool: False if no email was due.
+        """
+        with self.__claiming:
+            document = self.outbox.claim()
+            if document is None:
+                return False
+            documents = self.outbox.claim_digest(document)
+        delay = self.limiter.acquire(document["to"])
+        if delay:
+            # The server or the domain of the recipient reached its limit, the
+            # digest is sent in the next window.
+            self.outbox.postpone(documents, delay)
+            return True
+        if len(documents) == 1:
+            message = mime_message(
+                document["to"], document["subject"], document["message"]
+            )
+        else:
+            message = digest_message(
+                document["to"],
+                [(claimed["subject"], claimed["message"]) for claimed in documents],
+            )
+        try:
+            self.mailer.send(message)
+        except EmailSendError as error:
+            for claimed in documents:
+                self.outbox.retry(claimed, str(error))
+            return True
+        self.outbox.complete(documents)
+        self.logger.info(f"{len(documents)} emails sent to {document['to']}.")
+        return True
+
+    def __deliver(self) -> None:
+        """Send emails until stopped, waiting for new emails when the outbox
+        has none due, and for the next window when the server reached its
+        rate limit."""
+        while not self.__stopped.is_set():
+            delay = self.limiter.delay()
+            if delay:
+                self.__stopped.wait(delay)
+                continue
+            try:
+                delivered = self.deliver()
+            except PyMongoError as error:
+                self.logger.error(f"Unable to access the outbox: {error}")
+                delivered = False
+            if not delivered:
+                self.__stopped.wait(settings.OUTBOX_POLL_INTERVAL)
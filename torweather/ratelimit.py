@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""Module for limiting the rate of outbound emails with token buckets, so that
+bursts of notifications stay under the sending limits of the mail provider."""
+import threading
+import time
+from collections.abc import Iterable
+from collections.abc import MutableMapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from typing import Optional
+from typing import Tuple
+
+from torweather.config import settings
+
+# Number of emails and period (seconds) of a limit.
+Limit = Tuple[int, float]
+PERIODS = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
+
+
+def parse_limits(limits: str) -> Sequence[Limit]:
+    """Parse limits written as comma separated `<count>/<period>` values,
+    e.g. "20/minute,500/day".
+
+    Args:
+        limits (str): Limits to parse, an empty string for no limit.
+
+    Raises:
+        ValueError: A limit is not in the expected format.
+
+    Returns:
+        Sequence[Limit]: Number of emails and period of every limit.
+    """
+    parsed: MutableSequence[Limit] = []
+    for limit in filter(None, (limit.strip() for limit in limits.split(","))):
+        count, _, period = limit.partition("/")
+        if period not in PERIODS:
+            raise ValueError(f"Invalid rate limit {limit!r}.")
+        parsed.append((int(count), PERIODS[period]))
+    return parsed
+
+
+def domain(recipient: str) -> str:
+    """Returns the domain of the email address of a recipient."""
+    return recipient.rpartition("@")[2].lower()
+
+
+class TokenBucket:
+    """Bucket holding up to `capacity` tokens, refilled continuously with
+    `capacity` tokens per `period` seconds. Sending an email takes a token.
+
+    Attributes:
+        capacity (int): Maximum number of tokens, the size of a burst.
+        period (float): Seconds for refilling an empty bucket.
+        start (Optional[float]): Time (`time.monotonic`) at which the bucket
+            is full. Defaults to now.
+    """
+
+    def __init__(
+        self, capacity: int, period: float, start: Optional[float] = None
+    ) -> None:
+        self.capacity = capacity
+        self.period = period
+        self.__tokens = float(capacity)
+        self.__updated = time.monotonic() if start is None else start
+
+    def __refill(self, now: float) -> None:
+        elapsed = max(now - self.__updated, 0.0)
+        self.__tokens = min(
+            self.capacity, self.__tokens + elapsed * self.capacity / self.period
+        )
+        self.__updated = max(now, self.__updated)
+
+    def delay(self, now: float) -> float:
+        """Returns the seconds until a token is available, 0 if one is."""
+        self.__refill(now)
+        if self.__tokens >= 1:
+            return 0.0
+        return (1 - self.__tokens) * self.period / self.capacity
+
+    def take(self, now: float) -> None:
+        """Take a token, which must be available."""
+        self.__refill(now)
+        self.__tokens -= 1
+
+    def empty(self, now: float) -> None:
+        """Take every token."""
+        self.__tokens = 0.0
+        self.__updated = max(now, self.__updated)
+
+
+class RateLimiter:
+    """Class for limiting the emails sent over a mail server, with buckets
+    for the server and for every recipient domain. An email is sent only when
+    every bucket it draws from has a token, otherwise it waits for the next
+    window.
+
+    Attributes:
+        server_limits (Sequence[Limit]): Limits of the mail server.
+        domain_limits (Sequence[Limit]): Limits of every recipient domain.
+    """
+
+    def __init__(
+        self,
+        server_limits: Sequence[Limit] = parse_limits(settings.MAIL_RATE_LIMITS),
+        domain_limits: Sequence[Limit] = parse_limits(settings.MAIL_DOMAIN_RATE_LIMITS),
+    ) -> None:
+        self.domain_limits = domain_limits
+        self.__server = [TokenBucket(*limit) for limit in server_limits]
+        self.__domains: MutableMapping[str, Sequence[TokenBucket]] = {}
+        self.__lock = threading.Lock()
+
+    def __buckets(
+        self, domain: str, start: Optional[float] = None
+    ) -> Sequence[TokenBucket]:
+        """Returns the buckets of the server and a recipient domain."""
+        if domain not in self.__domains:
+            self.__domains[domain] = [
+                TokenBucket(*limit, start) for limit in self.domain_limits
+            ]
+        return [*self.__server, *self.__domains[domain]]
+
+    @property
+    def period(self) -> float:
+        """Returns the longest period of the limits, the time after which a
+        sent email no longer counts against them."""
+        periods = [bucket.period for bucket in self.__server]
+        periods.extend(period for _, period in self.domain_limits)
+        return max(periods, default=0.0)
+
+    def seed(self, sent: Iterable[Tuple[str, float]]) -> None:
+        """Refill the buckets from the emails sent over the last `period`
+        seconds, e.g. by the process which delivered before this one, so that
+        a restart does not grant a full allowance again. The buckets are full
+        one period ago, and take a token for every email sent since.
+
+        Args:
+            sent (Iterable[Tuple[str, float]]): Recipient and age (seconds) of
+                every email sent.
+        """
+        now = time.monotonic()
+        start = now - self.period
+        with self.__lock:
+            self.__server = [
+                TokenBucket(bucket.capacity, bucket.period, start)
+                for bucket in self.__server
+            ]
+            self.__domains = {}
+            for recipient, age in sorted(sent, key=lambda email: -email[1]):
+                for bucket in self.__buckets(domain(recipient), start):
+                    bucket.take(now - age)
+
+    def drain(self) -> None:
+        """Empty the buckets of the server, e.g. when the emails sent recently
+        are not known. They are full again after their period."""
+        now = time.monotonic()
+        with self.__lock:
+            for bucket in self.__server:
+                bucket.empty(now)
+
+    def delay(self) -> float:
+        """Returns the seconds until the server can send an email."""
+        now = time.monotonic()
+        with self.__lock:
+            return max((bucket.delay(now) for bucket in self.__server), default=0.0)
+
+    def acquire(self, recipient: str) -> float:
+        """Take a token for sending an email to a recipient, if every bucket
+        has one.
+
+        Args:
+            recipient (str): Email of the recipient.
+
+        Returns:
+            float: 0 if the email can be sent, else the seconds to wait before
+                trying again, in which case no token is taken.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            buckets = self.__buckets(domain(recipient))
+            wait = max((bucket.delay(now) for bucket in buckets), default=0.0)
+            if wait > 0:
+                return wait
+            for bucket in buckets:
+                bucket.take(now)
+        return 0.0
@@ -1,27 +1,63 @@
 #!/usr/bin/env python
 """Module for fetching, validating relay data and subscribe/unsubscribe them to
 Tor Weather service."""
+import re
+import time
 from collections.abc import Mapping
 from collections.abc import MutableMapping
 from collections.abc import Sequence
 from typing import Any
+from typing import NoReturn
+from typing import Optional
 
 import requests  # type: ignore
 from email_validator import validate_email
-from pymongo import MongoClient
+from pymongo import ReturnDocument
 from pymongo.collection import Collection
-from requests.structures import CaseInsensitiveDict  # type: ignore
+from pymongo.errors import DuplicateKeyError
 
-from torweather.config import secrets
+from torweather.config import settings
+from torweather.database import get_collection
+from torweather.database import insert_ignoring_duplicates
+from torweather.database import notif_status_update
 from torweather.exceptions import InvalidEmailError
 from torweather.exceptions import InvalidFingerprintError
 from torweather.exceptions import NotifNotSubscribedError
 from torweather.exceptions import RelayNotSubscribedError
 from torweather.exceptions import RelaySubscribedError
 from torweather.logger import Logger
+from torweather.onionoo import onionoo
 from torweather.schemas import Notif
+from torweather.schemas import RELAY_FIELDS
 from torweather.schemas import RelayData
 
+FINGERPRINT = re.compile(r"[0-9A-F]{40}")
+
+
+def subscription(
+    fingerprint: str, email: str, notifs: Sequence[Notif], duration: int = 48
+) -> MutableMapping[str, Any]:
+    """Create the document of a relay subscribed to the Tor weather service.
+
+    Args:
+        fingerprint (str): Fingerprint of the relay.
+        email (str): Email of relay provider.
+        notifs (Sequence[Notif]): Type(s) of notification(s) to subscribe.
+        duration (int): Duration before sending a notification (hours). Defaults to 48.
+
+    Returns:
+        MutableMapping[str, Any]: Document of the subscribers collection.
+    """
+    document: MutableMapping[str, Any] = {"fingerprint": fingerprint, "email": email}
+    # Create a dictionary with enum variable name as key and False as value.
+    # This dictionary will be used to keep track of notifications sent, thus
+    # the default value is False.
+    for notif in notifs:
+        document[notif.name] = {"sent": False}
+        if notif == Notif.NODE_DOWN:
+            document[notif.name]["duration"] = duration
+    return document
+
 
 class Relay(Logger):
     """Class for fetching data of a relay using the onionoo API and
@@ -30,33 +66,27 @@ class Relay(Logger):
     Attributes:
         fingerprint (str): Fingerprint of the relay.
         testing (bool): Use a test database for executing functions.
+        ttl (Optional[int]): Seconds for which fetched relay data is reused.
+            Defaults to the RELAY_DATA_TTL setting.
     """
 
-    def __init__(self, fingerprint: str, testing: bool = False) -> None:
+    def __init__(
+        self,
+        fingerprint: str,
+        testing: bool = False,
+        ttl: Optional[int] = None,
+    ) -> None:
         """Initializes the Relay class with the fields to be fetched by the
         onionoo API and a custom logger."""
         super().__init__(__name__)
         self.fingerprint = fingerprint
-        # Fields to fetch for a relay from the onionoo API.
-        self.__fields: Sequence[str] = [
-            "nickname",
-            "fingerprint",
-            "last_seen",
-            "running",
-            "consensus_weight",
-            "last_restarted",
-            "bandwidth_rate",
-            "effective_family",
-            "version_status",
-            "recommended_version",
-        ]
-        self.__url: str = "https://onionoo.torproject.org/details"
+        self.__fields: Sequence[str] = RELAY_FIELDS
+        self.__url: str = f"{onionoo.url}/details"
+        self.__ttl: int = settings.RELAY_DATA_TTL if ttl is None else ttl
+        self.__relay_data: Optional[RelayData] = None
+        self.__fetched_at: float = 0.0
         self.__validate_fingerprint()
-        self.__client = MongoClient(secrets.MONGODB_URI)
-        self.__database = (
-            self.__client["testtorweather"] if testing else self.__client["torweather"]
-        )
-        self.__collection = self.__database["subscribers"]
+        self.__collection = get_collection(testing=testing)
 
     @property
     def url(self) -> str:
@@ -69,42 +99,82 @@ class Relay(Logger):
         return self.__collection
 
     @property
-    def data(self):
-        """Fetch data of the relay using the onionoo API.
+    def data(self) -> RelayData:
+        """Returns data of the relay, fetched using the onionoo API if it has
+        not been fetched yet or is older than the TTL.
 
         Returns:
             RelayData: Pydantic model of relay data.
         """
-        with requests.Session() as session:
-            session.headers = CaseInsensitiveDict(  # type: ignore
-                {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                    "(KHTML, like Gecko)Chrome/94.0.4606.81 Safari/537.36"
-                }
-            )
-            response = session.get(
-                f"{self.url}?search={self.fingerprint}&fields={','.join(self.__fields)}"
-            )
-            result = response.json()["relays"]
-        return RelayData(**result[0])
+        if (
+            self.__relay_data is None
+            or time.monotonic() - self.__fetched_at > self.__ttl
+        ):
+            return self.refresh()
+        return self.__relay_data
+
+    def refresh(self) -> RelayData:
+        """Fetch data of the relay using the onionoo API, replacing the
+        memoized data.
+
+        Raises:
+            InvalidFingerprintError: Relay fingerprint not found on onionoo API.
+
+        Returns:
+            RelayData: Pydantic model of relay data.
+        """
+        # Malformed input is rejected without querying, and caching, onionoo.
+        if not FINGERPRINT.fullmatch(self.fingerprint.upper()):
+            raise InvalidFingerprintError(self.fingerprint)
+        try:
+            result = onionoo.get(
+                "details", search=self.fingerprint, fields=",".join(self.__fields)
+            )["relays"]
+        except requests.RequestException:
+            raise InvalidFingerprintError(self.fingerprint)
+        if not result:
+            raise InvalidFingerprintError(self.fingerprint)
+        self.__relay_data = RelayData(**result[0])
+        self.__fetched_at = time.monotonic()
+        return self.__relay_data
 
     @property
     def duration(self) -> int:
-        if not self.collection.find_one({"fingerprint": self.fingerprint}):
-            raise RelayNotSubscribedError(self.data.nickname, self.fingerprint)
-        notifs: Mapping[str, Any] = self.collection.find_one(
-            {"fingerprint": self.fingerprint}
+        document: Optional[Mapping[str, Any]] = self.collection.find_one(
+            {"fingerprint": self.fingerprint}, {"_id": 0, "NODE_DOWN.duration": 1}
         )
-        return notifs["NODE_DOWN"]["duration"]
+        if document is None:
+            raise RelayNotSubscribedError(self.__nickname, self.fingerprint)
+        return document["NODE_DOWN"]["duration"]
 
     @property
     def email(self) -> str:
-        if not self.collection.find_one({"fingerprint": self.fingerprint}):
-            raise RelayNotSubscribedError(self.data.nickname, self.fingerprint)
-        notifs: Mapping[str, Any] = self.collection.find_one(
-            {"fingerprint": self.fingerprint}
+        document: Optional[Mapping[str, Any]] = self.collection.find_one(
+            {"fingerprint": self.fingerprint}, {"_id": 0, "email": 1}
         )
-        return notifs["email"]
+        if document is None:
+            raise RelayNotSubscribedError(self.__nickname, self.fingerprint)
+        return document["email"]
+
+    @property
+    def __nickname(self) -> str:
+        """Returns the nickname of the relay from the memoized relay data, so
+        that raising an exception never queries the onionoo API."""
+        if self.__relay_data is None:
+            return self.fingerprint
+        return self.__relay_data.nickname
+
+    def __raise_not_subscribed(self, notif_type: Notif) -> NoReturn:
+        """Raise the error explaining why a write on a notification type of
+        the relay matched no document.
+
+        Raises:
+            RelayNotSubscribedError: Relay fingerprint not found in MongoDB database.
+            NotifNotSubscribedError: Notification type not subscribed by relay provider.
+        """
+        if self.collection.find_one({"fingerprint": self.fingerprint}, {"_id": 1}):
+            raise NotifNotSubscribedError(self.__nickname, self.fingerprint, notif_type)
+        raise RelayNotSubscribedError(self.__nickname, self.fingerprint)
 
     def __validate_fingerprint(self):
         """Validate whether the relay fingerprint exists.
@@ -112,19 +182,9 @@ class Relay(Logger):
         Raises:
             InvalidFingerprintError: Relay fingerprint not found on onionoo API.
         """
-        with requests.Session() as session:
-            session.headers = CaseInsensitiveDict(  # type: ignore
-                {
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                    "(KHTML, like Gecko)Chrome/94.0.4606.81 Safari/537.36"
-                }
-            )
-            response = session.get(f"{self.url}?search={self.fingerprint}")
-            if response.status_code != 200:
-                raise InvalidFingerprintError(self.fingerprint)
-            result = response.json()["relays"]
-            if not result:
-                raise InvalidFingerprintError(self.fingerprint)
+        # Fetching the relay data validates the fingerprint and memoizes
+        # the data for later use.
+        self.refresh()
 
     def subscribe(
         self, email: str, notifs: Sequence[Notif], duration: int = 48
@@ -146,35 +206,98 @@ class Relay(Logger):
         Returns:
             bool: True if relay data is added to database.
         """
-        # Validate the email address provided by the relay provider.
-        # If the email is in wrong syntax/DNS server doesn't exist
-        # it raises an error.
+        self.__validate_email(email)
+        data = self.data
+        # The unique index on `fingerprint` rejects a relay which already
+        # exists in the `torweather` collection, even if it was subscribed
+        # concurrently.
         try:
-            email_object = validate_email(email)
-        except:
-            raise InvalidEmailError(email)
-        # If the current fingerprint exists in a document in the `torweather`
-        # collection.
-        if self.collection.find_one({"fingerprint": self.fingerprint}):
-            raise RelaySubscribedError(self.data.nickname, self.fingerprint)
-        document: MutableMapping[str, Any] = {
-            "fingerprint": self.data.fingerprint,
-            "email": email,
-        }
-        # Create a dictionary with enum variable name as key and False as value.
-        # This dictionary will be used to keep track of notifications sent, thus
-        # the default value is False.
-        for notif in notifs:
-            document[notif.name] = {"sent": False}
-            if notif == Notif.NODE_DOWN:
-                document[notif.name]["duration"] = duration
-        self.collection.insert_one(document)
+            self.collection.insert_one(
+                subscription(data.fingerprint, email, notifs, duration)
+            )
+        except DuplicateKeyError:
+            raise RelaySubscribedError(data.nickname, self.fingerprint)
         self.logger.info(
-            f"Node {self.data.nickname} (fingerprint: {self.fingerprint}) subscribed to "
+            f"Node {data.nickname} (fingerprint: {self.fingerprint}) subscribed to "
             f"{', '.join([notif.name for notif in notifs])} notifications."
         )
         return True
 
+    def subscribe_family(
+        self, email: str, notifs: Sequence[Notif], duration: int = 48
+    ) -> Sequence[str]:
+        """Subscribe every relay of the effective family of the relay, itself
+        included, to the Tor weather service.
+
+        The members are resolved with a single family query of the onionoo
+        API, the members already subscribed are found with a single query, and
+        the others are inserted with a single bulk write.
+
+        Args:
+            email (str): Email of relay provider.
+            notifs (Sequence[Notif]): Type(s) of notification(s) to subscribe.
+            duration (int): Duration before sending a notification (hours). Defaults to 48.
+
+        Raises:
+            InvalidEmailError: Email syntax/DNS server is not valid.
+            InvalidFingerprintError: Family could not be fetched from onionoo API.
+
+        Returns:
+            Sequence[str]: Fingerprints of the relays subscribed by this call,
+                empty if the whole family was already subscribed.
+        """
+        self.__validate_email(email)
+        # The family parameter returns the relay and the members listing it
+        # in their family in turn, i.e. its effective family.
+        try:
+            result = onionoo.get(
+                "details", family=self.data.fingerprint, fields="fingerprint"
+            )
+        except requests.RequestException:
+            raise InvalidFingerprintError(self.fingerprint)
+        fingerprints = {relay["fingerprint"] for relay in result["relays"]}
+        subscribed = {
+            document["fingerprint"]
+            for document in self.collection.find(
+                {"fingerprint": {"$in": list(fingerprints)}},
+                {"_id": 0, "fingerprint": 1},
+            )
+        }
+        new = sorted(fingerprints - subscribed)
+        if not new:
+            return []
+        # A member subscribed in the meantime is left as it is.
+        duplicates = {
+            document["fingerprint"]
+            for document in insert_ignoring_duplicates(
+                self.collection,
+                [
+                    subscription(fingerprint, email, notifs, duration)
+                    for fingerprint in new
+                ],
+            )
+        }
+        new = [fingerprint for fingerprint in new if fingerprint not in duplicates]
+        self.logger.info(
+            f"{len(new)} relays of the family of node {self.data.nickname} "
+            f"(fingerprint: {self.fingerprint}) subscribed to "
+            f"{', '.join([notif.name for notif in notifs])} notifications."
+        )
+        return new
+
+    def __validate_email(self, email: str) -> None:
+        """Validate the email address provided by the relay provider.
+
+        Raises:
+            InvalidEmailError: Email syntax/DNS server is not valid.
+        """
+        # If the email is in wrong syntax/DNS server doesn't exist
+        # it raises an error.
+        try:
+            validate_email(email)
+        except:
+            raise InvalidEmailError(email)
+
     def unsubscribe(self) -> bool:
         """Unsubscribe from the Tor weather service.
 
@@ -189,11 +312,11 @@ class Relay(Logger):
         """
         # If the current fingerprint does not exist in a document in the
         # `torweather` collection.
-        if not self.collection.find_one({"fingerprint": self.fingerprint}):
-            raise RelayNotSubscribedError(self.data.nickname, self.fingerprint)
-        self.collection.delete_one({"fingerprint": self.fingerprint})
+        result = self.collection.delete_one({"fingerprint": self.fingerprint})
+        if not result.deleted_count:
+            raise RelayNotSubscribedError(self.__nickname, self.fingerprint)
         self.logger.info(
-            f"Node {self.data.nickname} (fingerprint: {self.fingerprint}) unsubscribed."
+            f"Node {self.__nickname} (fingerprint: {self.fingerprint}) unsubscribed."
         )
         return True
 
@@ -210,31 +333,34 @@ class Relay(Logger):
         Returns:
             bool: True if notification is unsubscribed.
         """
-        if not self.collection.find_one({"fingerprint": self.fingerprint}):
-            raise RelayNotSubscribedError(self.data.nickname, self.fingerprint)
-        document: Mapping[str, Any] = self.collection.find_one(
-            {"fingerprint": self.fingerprint}
+        # Only the notification fields subscribed before the update are
+        # returned.
+        document: Optional[Mapping[str, Any]] = self.collection.find_one_and_update(
+            {"fingerprint": self.fingerprint, notif_type.name: {"$exists": True}},
+            {"$unset": {notif_type.name: 1}},
+            projection={"_id": 0, **{notif.name: 1 for notif in Notif}},
+            return_document=ReturnDocument.BEFORE,
         )
-        if notif_type.name not in document:
-            raise NotifNotSubscribedError(
-                self.data.nickname, self.fingerprint, notif_type
-            )
-        # If only a single notification is subscribed and the user
+        if document is None:
+            self.__raise_not_subscribed(notif_type)
+        # If only a single notification was subscribed and the user
         # explicitly chooses to unsubscribe from it, delete the whole
         # relay from the database.
-        if len(document) > 4:
-            # The length of document should be greater than 4 as
-            # every document includes _id, fingerprint, email fields.
-            self.collection.update_one(
-                {"fingerprint": self.fingerprint},
-                {"$unset": {notif_type.name: 1}},
+        if len(document) == 1:
+            self.collection.delete_one(
+                {
+                    "fingerprint": self.fingerprint,
+                    **{notif.name: {"$exists": False} for notif in Notif},
+                }
+            )
+            self.logger.info(
+                f"Node {self.__nickname} (fingerprint: {self.fingerprint}) unsubscribed."
             )
-        else:
-            self.unsubscribe()
         return True
 
     def update_notif_status(self, notif_type: Notif, status: bool = True) -> bool:
         """Update the status of a notification subscribed by the relay operator.
+        Re-arming a notification starts a new incident, which is counted.
 
         Args:
             notif_type (Notif): The notification type to update.
@@ -247,17 +373,10 @@ class Relay(Logger):
         Returns:
             bool: True if notification's status is updated in the database.
         """
-        if not self.collection.find_one({"fingerprint": self.fingerprint}):
-            raise RelayNotSubscribedError(self.data.nickname, self.fingerprint)
-        document: Mapping[str, Any] = self.collection.find_one(
-            {"fingerprint": self.fingerprint}
-        )
-        if notif_type.name not in document:
-            raise NotifNotSubscribedError(
-                self.data.nickname, self.fingerprint, notif_type
-            )
-        self.collection.update_one(
-            {"fingerprint": self.fingerprint},
-            {"$set": {f"{notif_type.name}.sent": status}},
+        result = self.collection.update_one(
+            {"fingerprint": self.fingerprint, notif_type.name: {"$exists": True}},
+            notif_status_update(notif_type, status),
         )
+        if not result.matched_count:
+            self.__raise_not_subscribed(notif_type)
         return True
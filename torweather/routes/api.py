@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+"""Module for handling the "/api" endpoints of flask server, used by tools
+subscribing many relays at once. Requests are authenticated with the
+API_TOKEN secret, sent as an `Authorization: Bearer <token>` header."""
+import hmac
+
+from flask import Blueprint
+from flask import jsonify
+from flask import request
+
+from torweather.bulk import BulkSubscriber
+from torweather.config import secrets
+from torweather.config import settings
+
+api = Blueprint("api", __name__)
+
+
+@api.before_request
+def authenticate():
+    """Reject requests without the API token. Every request is rejected if no
+    token is configured."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if (
+        not secrets.API_TOKEN
+        or scheme.lower() != "bearer"
+        or not hmac.compare_digest(token.encode(), secrets.API_TOKEN.encode())
+    ):
+        return (
+            jsonify(error="Invalid or missing API token."),
+            401,
+            {"WWW-Authenticate": "Bearer"},
+        )
+    return None
+
+
+@api.route("/subscriptions", methods=["POST"], strict_slashes=False)
+def subscriptions():
+    """Subscribe a batch of relays, given as a JSON list of
+    {"fingerprint", "email", "notifs", "duration"} objects. Returns the result
+    of every entry in order, see `BulkSubscriber.subscribe`."""
+    entries = request.get_json(silent=True)
+    if not isinstance(entries, list):
+        return jsonify(error="Expected a JSON list of subscriptions."), 400
+    if len(entries) > settings.API_MAX_BATCH_SIZE:
+        return (
+            jsonify(
+                error=f"At most {settings.API_MAX_BATCH_SIZE} subscriptions per request."
+            ),
+            413,
+        )
+    results = BulkSubscriber().subscribe(entries)
+    return jsonify(results=results)
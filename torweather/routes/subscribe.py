@@ -8,6 +8,7 @@ from flask import request
 
 from torweather.exceptions import InvalidEmailError
 from torweather.exceptions import InvalidFingerprintError
+from torweather.exceptions import RelaySubscribedError
 from torweather.relay import Relay
 from torweather.schemas import Notif
 
@@ -22,6 +23,7 @@ def main():
         fingerprint: str = request.form.get("fingerprint")
         node_down: str = request.form.get("node-down")
         outdated_ver: str = request.form.get("outdated-ver")
+        family: str = request.form.get("family")
         duration: int = (
             int(request.form.get("duration"))
             if request.form.get("duration") != ""
@@ -46,6 +48,22 @@ def main():
                     error="Choose at least one notification to subscribe.",
                 )
             relay = Relay(fingerprint)
+            if family == "on":
+                members: Sequence[str] = relay.subscribe_family(email, notifs, duration)
+                if not members:
+                    # The whole family has already subscribed.
+                    return render_template(
+                        "subscribe.html",
+                        subscribed=False,
+                        nickname=relay.data.nickname,
+                        fingerprint=fingerprint,
+                    )
+                return render_template(
+                    "subscribe.html",
+                    family=len(members),
+                    nickname=relay.data.nickname,
+                    fingerprint=fingerprint,
+                )
             result: bool = relay.subscribe(email, notifs, duration)
             if result:
                 return render_template(
@@ -61,6 +79,13 @@ def main():
                     nickname=relay.data.nickname,
                     fingerprint=fingerprint,
                 )
+        except RelaySubscribedError:
+            return render_template(
+                "subscribe.html",
+                subscribed=False,
+                nickname=relay.data.nickname,
+                fingerprint=fingerprint,
+            )
         except InvalidEmailError:
             return render_template("subscribe.html", error="Not a valid email address.")
         except InvalidFingerprintError:
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""Module for evaluating the notification rules of all subscriptions of a
+check at once, over columns of relay data."""
+import math
+import operator
+from array import array
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Mapping
+from collections.abc import MutableMapping
+from collections.abc import MutableSequence
+from collections.abc import Sequence
+from datetime import datetime
+from datetime import timezone
+from functools import partial
+from itertools import compress
+from typing import Any
+from typing import Optional
+
+from torweather.schemas import RelayRecord
+
+# Onionoo times are naive datetimes in UTC.
+EPOCH = datetime(1970, 1, 1)
+
+
+class Subscriptions:
+    """Table of subscriptions joined with the relay data of a snapshot, stored
+    as one column per field. Subscriptions of relays missing from the
+    snapshot are left out.
+
+    Attributes:
+        documents (Iterable[Mapping[str, Any]]): Documents of the subscribers
+            collection.
+        relays (Mapping[str, RelayRecord]): Fingerprint to relay data map,
+            with at least the fields in STATUS_FIELDS.
+        notif_types (Sequence[str]): Notification types to evaluate.
+    """
+
+    def __init__(
+        self,
+        documents: Iterable[Mapping[str, Any]],
+        relays: Mapping[str, RelayRecord],
+        notif_types: Sequence[str],
+    ) -> None:
+        """Initializes the Subscriptions class by filling the columns."""
+        self.notif_types = notif_types
+        # The columns are built one at a time, mostly with `map`, so that the
+        # join and the conversions run in C instead of a Python loop over rows.
+        documents = list(documents)
+        fingerprints = [document["fingerprint"] for document in documents]
+        joined = list(map(relays.get, fingerprints))
+        found = [record is not None for record in joined]
+        self.missing: MutableSequence[str] = list(
+            compress(fingerprints, map(operator.not_, found))
+        )
+        if self.missing:
+            documents = list(compress(documents, found))
+            fingerprints = list(compress(fingerprints, found))
+            joined = list(compress(joined, found))
+        self.fingerprints: MutableSequence[str] = fingerprints
+        self.documents: Sequence[Mapping[str, Any]] = documents
+        self.emails: MutableSequence[str] = list(
+            map(operator.itemgetter("email"), documents)
+        )
+        self.records: MutableSequence[RelayRecord] = joined  # type: ignore
+        # NODE_DOWN duration in hours, infinite if not subscribed.
+        self.durations = array(
+            "d",
+            [
+                document.get("NODE_DOWN", {}).get("duration", math.inf)
+                for document in documents
+            ],
+        )
+        # Timestamps (seconds since epoch) the relays were last seen.
+        self.last_seen = array(
+            "d", [(record.last_seen - EPOCH).total_seconds() for record in self.records]
+        )
+        self.running = bytearray(map(operator.attrgetter("running"), joined))
+        self.version_status: MutableSequence[Optional[str]] = list(
+            map(operator.attrgetter("version_status"), joined)
+        )
+        # Whether the notification is subscribed and not sent yet.
+        self.pending: Mapping[str, bytearray] = {
+            notif: bytearray(
+                document.get(notif, {}).get("sent") is False for document in documents
+            )
+            for notif in notif_types
+        }
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    def incident(self, index: int, notif: str) -> int:
+        """Returns the number of the current incident of a notification of a
+        subscription, incremented every time the notification is re-armed."""
+        incident: int = self.documents[index].get(notif, {}).get("incident", 0)
+        return incident
+
+    def duration(self, index: int) -> Optional[int]:
+        """Returns the NODE_DOWN duration of a subscription, None if the
+        notification is not subscribed."""
+        duration = self.durations[index]
+        return int(duration) if math.isfinite(duration) else None
+
+
+# A rule returns, for every subscription, whether its notification is due.
+Rule = Callable[[Subscriptions, float], Sequence[bool]]
+RULES: MutableMapping[str, Rule] = {}
+
+
+def rule(notif: str) -> Callable[[Rule], Rule]:
+    """Register the rule deciding when a notification type is sent.
+
+    Args:
+        notif (str): Name of the notification type.
+
+    Returns:
+        Callable[[Rule], Rule]: Decorator registering the rule.
+    """
+
+    def register(function: Rule) -> Rule:
+        RULES[notif] = function
+        return function
+
+    return register
+
+
+@rule("NODE_DOWN")
+def node_down(subscriptions: Subscriptions, now: float) -> Sequence[bool]:
+    """The relay has been down for more hours than the subscribed duration."""
+    return [
+        (now - last_seen) // 3600 > duration
+        for last_seen, duration in zip(subscriptions.last_seen, subscriptions.durations)
+    ]
+
+
+def node_down_deadlines(subscriptions: Subscriptions) -> Sequence[float]:
+    """Returns, for every subscription, the time (seconds since epoch) from
+    which the NODE_DOWN rule is true if the relay is not seen again. It is
+    infinite if NODE_DOWN is not subscribed."""
+    return [
+        last_seen + (duration + 1) * 3600
+        for last_seen, duration in zip(subscriptions.last_seen, subscriptions.durations)
+    ]
+
+
+@rule("OUTDATED_VER")
+def outdated_version(subscriptions: Subscriptions, now: float) -> Sequence[bool]:
+    """The relay runs a Tor version which is not recommended anymore."""
+    # A relay which reported no version has no version status.
+    return list(
+        map(partial(operator.eq, "unrecommended"), subscriptions.version_status)
+    )
+
+
+@rule("END_OF_LIFE_VER")
+def end_of_life_version(subscriptions: Subscriptions, now: float) -> Sequence[bool]:
+    """The relay runs a Tor version which is not supported anymore."""
+    return list(map(partial(operator.eq, "obsolete"), subscriptions.version_status))
+
+
+def evaluate(
+    subscriptions: Subscriptions, now: Optional[datetime] = None
+) -> Mapping[str, Sequence[int]]:
+    """Evaluate the rule of every notification type over all subscriptions.
+
+    Args:
+        subscriptions (Subscriptions): Table of subscriptions.
+        now (Optional[datetime]): Time of evaluation (UTC). Defaults to now.
+
+    Returns:
+        Mapping[str, Sequence[int]]: Notification type to the indexes of the
+            subscriptions whose notification is pending and due.
+    """
+    timestamp = (now or datetime.utcnow()).replace(tzinfo=timezone.utc).timestamp()
+    due: MutableMapping[str, Sequence[int]] = {}
+    for notif in subscriptions.notif_types:
+        if notif not in RULES:
+            continue
+        matches = RULES[notif](subscriptions, timestamp)
+        due[notif] = [
+            index
+            for index, (pending, match) in enumerate(
+                zip(subscriptions.pending[notif], matches)
+            )
+            if pending and match
+        ]
+    return due
@@ -2,9 +2,13 @@
 """Module for enums and schemas used by torweather modules."""
 import enum
 import os
+from collections.abc import Collection
 from collections.abc import Mapping
 from collections.abc import Sequence
 from datetime import datetime
+from typing import Any
+from typing import Optional
+from typing import Union
 
 from pydantic import BaseModel
 
@@ -47,6 +51,38 @@ class Notif(enum.Enum):
     OPERATOR_EVENTS: Mapping[str, str]
 
 
+# Content of an email combining the notifications sent to the same address.
+DIGEST: Mapping[str, str] = email_content(
+    "{0} notifications about your relays", "digest.txt"
+)
+
+# Fields to fetch for a relay from the onionoo API.
+RELAY_FIELDS: Sequence[str] = [
+    "nickname",
+    "fingerprint",
+    "last_seen",
+    "running",
+    "consensus_weight",
+    "last_restarted",
+    "bandwidth_rate",
+    "effective_family",
+    "version_status",
+    "recommended_version",
+]
+# Fields needed by the notification rules, fetched for every subscribed relay
+# before fetching all RELAY_FIELDS of the relays with a notification due.
+STATUS_FIELDS: Sequence[str] = [
+    "fingerprint",
+    "last_seen",
+    "running",
+    "version_status",
+]
+# Fields onionoo returns for every relay, which are always fetched. The others
+# are left out of a relay which has no value for them, e.g. version_status if
+# it reported no version.
+REQUIRED_FIELDS: Sequence[str] = ["fingerprint", "last_seen", "running"]
+
+
 class RelayData(BaseModel):
     """Pydantic model for storing and validating relay data."""
 
@@ -60,3 +96,86 @@ class RelayData(BaseModel):
     effective_family: Sequence[str]
     version_status: str
     recommended_version: bool
+
+
+class RelayRecord:
+    """Compact record of relay data taken from a trusted onionoo document.
+
+    Snapshots hold thousands of relays, so unlike RelayData the record is not
+    validated by pydantic and uses slots instead of an instance dictionary.
+    It has the same attributes as RelayData.
+    """
+
+    __slots__ = tuple(RELAY_FIELDS)
+
+    def __init__(
+        self,
+        nickname: Optional[str],
+        fingerprint: str,
+        last_seen: datetime,
+        running: bool,
+        consensus_weight: Optional[int],
+        last_restarted: Optional[datetime],
+        bandwidth_rate: Optional[int],
+        effective_family: Optional[Sequence[str]],
+        version_status: Optional[str],
+        recommended_version: Optional[bool],
+    ) -> None:
+        self.nickname = nickname
+        self.fingerprint = fingerprint
+        self.last_seen = last_seen
+        self.running = running
+        self.consensus_weight = consensus_weight
+        self.last_restarted = last_restarted
+        self.bandwidth_rate = bandwidth_rate
+        self.effective_family = effective_family
+        self.version_status = version_status
+        self.recommended_version = recommended_version
+
+    @classmethod
+    def from_onionoo(
+        cls, relay: Mapping[str, Any], fields: Collection[str] = RELAY_FIELDS
+    ) -> "RelayRecord":
+        """Create a record from a relay of an onionoo details document.
+
+        Args:
+            relay (Mapping[str, Any]): Relay with the requested fields.
+            fields (Collection[str], optional): Fields requested from onionoo,
+                the others are set to None, except REQUIRED_FIELDS which are
+                always read. Defaults to RELAY_FIELDS.
+
+        Raises:
+            KeyError: A field of REQUIRED_FIELDS is missing.
+            ValueError: A date is not in the onionoo format.
+
+        Returns:
+            RelayRecord: Record of relay data.
+        """
+
+        def optional(field: str) -> Any:
+            return relay.get(field) if field in fields else None
+
+        last_restarted = optional("last_restarted")
+        effective_family = optional("effective_family")
+        return cls(
+            nickname=optional("nickname"),
+            fingerprint=relay["fingerprint"],
+            last_seen=datetime.fromisoformat(relay["last_seen"]),
+            running=relay["running"],
+            consensus_weight=optional("consensus_weight"),
+            last_restarted=(
+                datetime.fromisoformat(last_restarted)
+                if last_restarted is not None
+                else None
+            ),
+            bandwidth_rate=optional("bandwidth_rate"),
+            effective_family=(
+                tuple(effective_family) if effective_family is not None else None
+            ),
+            version_status=optional("version_status"),
+            recommended_version=optional("recommended_version"),
+        )
+
+
+# Relay data either validated at the API boundary or taken from a snapshot.
+AnyRelayData = Union[RelayData, RelayRecord]
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""Module for downloading a snapshot of all relays from the onionoo API once
+per check, instead of querying the API for every subscribed relay."""
+from collections.abc import Collection
+from collections.abc import Iterator
+from collections.abc import Mapping
+from collections.abc import MutableMapping
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Optional
+
+import requests  # type: ignore
+
+from torweather.config import settings
+from torweather.logger import Logger
+from torweather.onionoo import onionoo
+from torweather.schemas import RELAY_FIELDS
+from torweather.schemas import REQUIRED_FIELDS
+from torweather.schemas import RelayRecord
+
+
+class Snapshot(Logger):
+    """Class for fetching the details document of every relay using the onionoo
+    API and storing it as a fingerprint to RelayRecord map.
+
+    A few subscribed relays are looked up one fingerprint per request, as
+    the `lookup` parameter of onionoo takes a single fingerprint, which costs
+    fewer bytes than downloading the whole network. Past the lookup
+    threshold, every relay is downloaded with a single request instead.
+
+    Attributes:
+        lookup_threshold (int): Maximum number of relays to look up.
+        workers (int): Number of lookup requests sent concurrently.
+    """
+
+    def __init__(
+        self,
+        lookup_threshold: int = settings.ONIONOO_LOOKUP_THRESHOLD,
+        workers: int = settings.ONIONOO_LOOKUP_WORKERS,
+    ) -> None:
+        """Initializes the Snapshot class with an empty relay map and a custom
+        logger."""
+        super().__init__(__name__)
+        self.lookup_threshold = lookup_threshold
+        self.workers = workers
+        self.__fields: Sequence[str] = RELAY_FIELDS
+        self.__relays: MutableMapping[str, RelayRecord] = {}
+
+    @property
+    def relays(self) -> Mapping[str, RelayRecord]:
+        """Returns the fingerprint to relay data map of the last sync."""
+        return self.__relays
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self.__relays
+
+    def __len__(self) -> int:
+        return len(self.__relays)
+
+    def get(self, fingerprint: str) -> Optional[RelayRecord]:
+        """Returns the data of a relay from the snapshot.
+
+        Args:
+            fingerprint (str): Fingerprint of the relay.
+
+        Returns:
+            Optional[RelayRecord]: Data of the relay, None if it is not in the snapshot.
+        """
+        return self.__relays.get(fingerprint)
+
+    def __download(self, fields: Sequence[str]) -> Iterator[Mapping[str, Any]]:
+        """Yields the details of every relay of the network, streamed from a
+        single request."""
+        yield from onionoo.stream(
+            "details", "relays", type="relay", fields=",".join(fields)
+        )
+
+    def __lookup(
+        self, fingerprints: Collection[str], fields: Sequence[str]
+    ) -> Iterator[Mapping[str, Any]]:
+        """Yields the details of the relays with the given fingerprints, looked
+        up with one request per fingerprint, each cached on its own."""
+
+        def lookup(fingerprint: str) -> Sequence[Mapping[str, Any]]:
+            try:
+                document = onionoo.get(
+                    "details",
+                    type="relay",
+                    lookup=fingerprint,
+                    fields=",".join(fields),
+                )
+            except requests.HTTPError as error:
+                # Onionoo answers a malformed fingerprint with 400 Bad Request.
+                if error.response is not None and error.response.status_code == 400:
+                    return []
+                raise
+            relays: Sequence[Mapping[str, Any]] = document.get("relays", [])
+            return relays
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for relays in executor.map(lookup, sorted(fingerprints)):
+                yield from relays
+
+    def fetch(
+        self,
+        fingerprints: Optional[Collection[str]] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Mapping[str, RelayRecord]:
+        """Fetch the details of the relays using the onionoo API, restricted to
+        the given fields, without storing them in the snapshot.
+
+        If at most `lookup_threshold` fingerprints are given, the relays are
+        looked up one at a time, `workers` at once. Otherwise, the
+        details document of all relays is downloaded with a single request and
+        parsed one relay at a time, and only the relays in `fingerprints` are
+        kept, so memory use grows with the number of subscribed relays instead
+        of the size of the Tor network.
+
+        Args:
+            fingerprints (Optional[Collection[str]]): Fingerprints of the relays
+                to keep. Defaults to None, which keeps every relay.
+            fields (Optional[Sequence[str]]): Fields to fetch besides
+                REQUIRED_FIELDS, the others are set to None in the records.
+                Defaults to RELAY_FIELDS.
+
+        Returns:
+            Mapping[str, RelayRecord]: Fingerprint to relay data map.
+        """
+        # The required fields are always fetched, as every record has them.
+        fields = list(dict.fromkeys([*REQUIRED_FIELDS, *(fields or self.__fields)]))
+        if fingerprints is not None and len(fingerprints) <= self.lookup_threshold:
+            details = self.__lookup(fingerprints, fields)
+        else:
+            details = self.__download(fields)
+        relays: MutableMapping[str, RelayRecord] = {}
+        for relay in details:
+            if (
+                fingerprints is not None
+                and relay.get("fingerprint") not in fingerprints
+            ):
+                continue
+            # A single malformed relay should not stop the check of every
+            # other subscribed relay.
+            try:
+                relays[relay["fingerprint"]] = RelayRecord.from_onionoo(relay, fields)
+            except (KeyError, TypeError, ValueError):
+                self.logger.warning(
+                    f"Skipping relay {relay.get('fingerprint')} with incomplete data."
+                )
+        return relays
+
+    def sync(
+        self,
+        fingerprints: Optional[Collection[str]] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Mapping[str, RelayRecord]:
+        """Fetch the details of the relays and replace the snapshot with them.
+
+        Args:
+            fingerprints (Optional[Collection[str]]): Fingerprints of the relays
+                to keep. Defaults to None, which keeps every relay.
+            fields (Optional[Sequence[str]]): Fields to fetch. Defaults to
+                RELAY_FIELDS.
+
+        Returns:
+            Mapping[str, RelayRecord]: Fingerprint to relay data map.
+        """
+        self.__relays = dict(self.fetch(fingerprints, fields))
+        self.logger.info(f"Snapshot of {len(self.__relays)} relays synced.")
+        return self.relays
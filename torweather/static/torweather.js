@@ -15,7 +15,7 @@ function validate() {
 function toggleAll(source) {
     var checkboxes = document.querySelectorAll('input[type="checkbox"]');
     for (var i = 0; i < checkboxes.length; i++) {
-        if (checkboxes[i] != source)
+        if (checkboxes[i] != source && checkboxes[i].name != "family")
             checkboxes[i].checked = source.checked;
     }
 }
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Module for running the scheduled checks in a separate worker process. Can be
+run as `python -m torweather.worker`.
+
+Any number of workers can run, only the one holding the scheduler lease runs
+the checks and delivers the emails they queue in the outbox, so that a single
+process keeps track of the rate limits of the mail server. The others take over
+within seconds if it dies."""
+import signal
+import threading
+from typing import Any
+
+from pymongo.errors import PyMongoError
+
+from torweather.check import Check
+from torweather.config import settings
+from torweather.indexes import Indexes
+from torweather.lease import Lease
+from torweather.logger import Logger
+from torweather.mailer import Mailer
+from torweather.outbox import Deliverer
+
+
+class Worker(Logger):
+    """Class for running the scheduler of checks and delivering emails while
+    holding the scheduler lease, and pausing both while another process holds
+    it.
+
+    Attributes:
+        check (Check): Check with the scheduled jobs.
+        lease (Lease): Lease held by the process running the jobs.
+        deliverer (Deliverer): Deliverer of the emails queued by the checks.
+    """
+
+    def __init__(self, check: Check, lease: Lease, deliverer: Deliverer) -> None:
+        """Initializes the Worker class with a custom logger."""
+        super().__init__(__name__)
+        self.check = check
+        self.lease = lease
+        self.deliverer = deliverer
+        self.__leader = False
+        self.__stopped = threading.Event()
+
+    @property
+    def leader(self) -> bool:
+        """Returns whether this process runs the jobs."""
+        return self.__leader
+
+    def __elect(self) -> None:
+        """Acquire or renew the lease, and resume or pause the jobs."""
+        try:
+            leader = self.lease.acquire()
+        except PyMongoError as error:
+            # The lease cannot be renewed, so it must be assumed lost before
+            # it expires and is taken by another process.
+            self.logger.error(f"Unable to acquire lease {self.lease.name}: {error}")
+            leader = False
+        if leader and not self.leader:
+            self.logger.info(f"{self.lease.owner} acquired lease {self.lease.name}.")
+            # Another process might have run the checks since this one last
+            # held the lease.
+            self.check.reset()
+            self.check.scheduler.resume()
+            self.deliverer.start()
+        elif not leader and self.leader:
+            self.logger.warning(f"{self.lease.owner} lost lease {self.lease.name}.")
+            self.check.scheduler.pause()
+            self.deliverer.stop()
+        self.__leader = leader
+
+    def run(self) -> None:
+        """Renew the lease until stopped. Jobs already running when the lease
+        is lost are not interrupted."""
+        self.check.scheduler.start(paused=True)
+        try:
+            while not self.__stopped.is_set():
+                self.__elect()
+                self.__stopped.wait(settings.LEASE_RENEW_INTERVAL)
+        finally:
+            self.check.scheduler.shutdown(wait=False)
+            if self.leader:
+                self.deliverer.stop()
+                try:
+                    self.lease.release()
+                except PyMongoError:
+                    pass
+                self.__leader = False
+
+    def stop(self, *args: Any) -> None:
+        """Stop renewing the lease. Can be used as a signal handler."""
+        self.__stopped.set()
+
+
+def main() -> None:
+    """Run a worker until it is terminated."""
+    Indexes().ensure()
+    check = Check()
+    check.outbox.ensure()
+    worker = Worker(check, Lease("scheduler"), Deliverer(check.outbox, Mailer()))
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()